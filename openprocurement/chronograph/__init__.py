@@ -1,15 +1,38 @@
 import gevent.monkey
 gevent.monkey.patch_all()
+import atexit
 import os
 from logging import getLogger
 # from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_SCHEDULER_SHUTDOWN
 from apscheduler.schedulers.gevent import GeventScheduler as Scheduler
 from datetime import datetime, timedelta
-# from openprocurement.chronograph.jobstores import CouchDBJobStore
+from openprocurement.chronograph.cluster import Cluster
 from openprocurement.chronograph.database import set_chronograph_security
-from openprocurement.chronograph.scheduler import push
+from openprocurement.chronograph.follower import FeedFollower
+from openprocurement.chronograph.index import PlanIndex
+from openprocurement.chronograph.jobstores import CouchDBJobStore, SQLAlchemyJobStore, TimerWheelJobStore, iter_jobs
+from openprocurement.chronograph.metrics import MeteredGeventExecutor
+from openprocurement.chronograph.planner import Planner
+from openprocurement.chronograph.scheduler import (
+    CALENDAR_ID,
+    OUTBOUND,
+    RETRY,
+    SMOOTHER,
+    STREAMS_ID,
+    SYNC_ID,
+    get_sync,
+    push,
+    rebalance_jobs,
+    requeue_job,
+    set_callback_url,
+    set_coalesce_window,
+    set_dispatcher,
+)
 from openprocurement.chronograph.utils import add_logging_context
 from pyramid.config import Configurator
+from pyramid.exceptions import ConfigurationError
+from pyramid.settings import asbool
 from pytz import timezone
 from pyramid.events import ApplicationCreated, ContextFound
 
@@ -22,6 +45,32 @@ TZ = timezone(os.environ['TZ'] if 'TZ' in os.environ else 'Europe/Kiev')
 def start_scheduler(event):
     app = event.app
     app.registry.scheduler.start()
+    SMOOTHER.load([run_time for _, run_time in iter_jobs(app.registry.scheduler, start=datetime.now(TZ))])
+
+
+def start_plan_index(event):
+    app = event.app
+    app.registry.plan_index.start()
+
+
+def start_cluster(event):
+    app = event.app
+    if app.registry.cluster:
+        app.registry.cluster.start()
+
+
+def start_follower(event):
+    app = event.app
+    if app.registry.follower:
+        app.registry.follower.start()
+
+
+def stop_services(registry):
+    if registry.follower:
+        registry.follower.stop()
+    if registry.cluster:
+        registry.cluster.stop()
+    registry.plan_index.stop()
 
 
 def main(global_config, **settings):
@@ -31,6 +80,10 @@ def main(global_config, **settings):
     config.add_subscriber(add_logging_context, ContextFound)
     config.include('pyramid_exclog')
     config.add_route('home', '/')
+    config.add_route('jobs', '/jobs')
+    config.add_route('jobs_summary', '/jobs/summary')
+    config.add_route('metrics', '/metrics')
+    config.add_route('sync', '/sync')
     config.add_route('resync_all', '/resync_all')
     config.add_route('resync_back', '/resync_back')
     config.add_route('resync', '/resync/{tender_id}')
@@ -40,38 +93,88 @@ def main(global_config, **settings):
     config.add_route('streams', '/streams')
     config.scan(ignore='openprocurement.chronograph.tests')
     config.add_subscriber(start_scheduler, ApplicationCreated)
+    config.add_subscriber(start_plan_index, ApplicationCreated)
+    config.add_subscriber(start_cluster, ApplicationCreated)
+    config.add_subscriber(start_follower, ApplicationCreated)
     config.registry.api_token = os.environ.get('API_TOKEN', settings.get('api.token'))
 
     server, db = set_chronograph_security(settings)
     config.registry.couchdb_server = server
     config.registry.db = db
+    config.registry.plan_index = PlanIndex(db, watch=(CALENDAR_ID, STREAMS_ID))
+    config.registry.planner = Planner(db, config.registry.plan_index)
 
-    jobstores = {
-        #'default': CouchDBJobStore(database=db_name, client=server)
+    jobstores = {}
+    if settings.get('jobstore') == 'couchdb':
+        jobstores['default'] = CouchDBJobStore(db)
+    elif settings.get('jobstore') == 'wheel':
+        jobstores['default'] = TimerWheelJobStore(
+            settings.get('wheel.snapshot'),
+            snapshot_interval=int(settings.get('wheel.snapshot_interval', 60)))
+    executors = {
+        'default': MeteredGeventExecutor(),
     }
-    #executors = {
-        #'default': ThreadPoolExecutor(5),
-        #'processpool': ProcessPoolExecutor(5)
-    #}
     job_defaults = {
         'coalesce': False,
-        'max_instances': 3
+        'max_instances': 3,
+        'misfire_grace_time': 60 * 60,
     }
     config.registry.api_url = settings.get('api.url')
     config.registry.callback_url = settings.get('callback.url')
+    set_callback_url(config.registry.callback_url)
+    config.registry.sync_queue_size = int(settings.get('sync.queue_size', 2))
+    if settings.get('callback.dispatch', 'http') == 'local':
+        set_dispatcher(config.registry)
+    RETRY.configure(settings)
+    if 'sync.coalesce_window' in settings:
+        set_coalesce_window(int(settings['sync.coalesce_window']))
+    OUTBOUND.configure(settings)
+    SMOOTHER.configure(settings)
     scheduler = Scheduler(jobstores=jobstores,
-                          #executors=executors,
+                          executors=executors,
                           job_defaults=job_defaults,
                           timezone=TZ)
     if 'jobstore_db' in settings:
-        scheduler.add_jobstore('sqlalchemy', url=settings['jobstore_db'])
+        scheduler.add_jobstore(SQLAlchemyJobStore(url=settings['jobstore_db']))
+    scheduler.add_listener(lambda event: requeue_job(scheduler, event), EVENT_JOB_ERROR)
     config.registry.scheduler = scheduler
+    config.registry.cluster = None
+    config.registry.sync_id = SYNC_ID
+    if 'cluster.node_id' in settings:
+        if settings.get('jobstore') == 'couchdb':
+            raise ConfigurationError("cluster.node_id needs a job store of its own, "
+                                     "jobstore = couchdb is shared by all nodes")
+        config.registry.sync_id = '{}_{}'.format(SYNC_ID, settings['cluster.node_id'])
+        config.registry.cluster = Cluster(
+            db, settings['cluster.node_id'],
+            lease_ttl=int(settings.get('cluster.lease_ttl', 30)),
+            heartbeat=int(settings.get('cluster.heartbeat', 10)),
+            on_change=lambda cluster: rebalance_jobs(scheduler, config.registry.callback_url, cluster,
+                                                     db, config.registry.sync_id))
     # scheduler.remove_all_jobs()
     # scheduler.start()
+    config.registry.follower = None
+    if asbool(settings.get('sync.follow', False)):
+        config.registry.follower = FeedFollower(
+            config.registry,
+            min_delay=float(settings.get('sync.follow_min_delay', 1)),
+            max_delay=float(settings.get('sync.follow_max_delay', 30)))
+    scheduler.add_listener(lambda event: stop_services(config.registry), EVENT_SCHEDULER_SHUTDOWN)
+    atexit.register(stop_services, config.registry)
+    sync = get_sync(db, config.registry.sync_id)
+    forward = sync.get('forward', {})
+    backward = sync.get('backward', {})
     resync_all_job = scheduler.get_job('resync_all')
     now = datetime.now(TZ)
-    if not resync_all_job or resync_all_job.next_run_time < now - timedelta(hours=1):
-        if resync_all_job:
+    if config.registry.follower:
+        LOGGER.info("Following feed from '{}'".format(forward.get('url', '')),
+                    extra={'MESSAGE_ID': 'follow_feed'})
+    elif not resync_all_job or resync_all_job.next_run_time < now - timedelta(hours=1):
+        if forward.get('url'):
+            LOGGER.info("Resume resync all from '{}'".format(forward['url']),
+                        extra={'MESSAGE_ID': 'resume_resync_all'})
+            args = [settings.get('callback.url') + 'resync_all', {'url': forward['url']}]
+        elif resync_all_job:
             args = resync_all_job.args
         else:
             args = [settings.get('callback.url') + 'resync_all', None]
@@ -79,4 +182,11 @@ def main(global_config, **settings):
         scheduler.add_job(push, 'date', run_date=run_date, timezone=TZ,
                           id='resync_all', args=args,
                           replace_existing=True, misfire_grace_time=60 * 60)
+    if backward.get('url') and not backward.get('stopped') and not scheduler.get_job('resync_back'):
+        LOGGER.info("Resume resync back from '{}'".format(backward['url']),
+                    extra={'MESSAGE_ID': 'resume_resync_back'})
+        scheduler.add_job(push, 'date', run_date=now + timedelta(seconds=60), timezone=TZ,
+                          id='resync_back', name="Resync back", misfire_grace_time=60 * 60,
+                          args=[settings.get('callback.url') + 'resync_back', {'url': backward['url']}],
+                          replace_existing=True)
     return config.make_wsgi_app()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from couchdb.http import ResourceConflict
+from gevent import sleep, spawn
+from hashlib import md5
+from logging import getLogger
+from socket import gethostname
+from time import time
+
+LOGGER = getLogger(__name__)
+NODE_PREFIX = 'node_'
+
+
+def node_weight(node_id, tender_id):
+    return md5('{}:{}'.format(node_id, tender_id)).hexdigest()
+
+
+class Cluster(object):
+    """Membership of chronograph nodes sharing one database.
+
+    Every node keeps a `node_<id>` lease document alive by renewing its
+    expiry each `heartbeat` seconds; nodes with unexpired leases are live.
+    Tender ids are assigned to live nodes by rendezvous hashing, so a node
+    joining or leaving only moves the tenders it gains or loses.
+    `on_change` is called with the cluster when membership changes;
+    `gained` tells whether the change may have moved tenders to this node.
+    """
+
+    def __init__(self, db, node_id=None, lease_ttl=30, heartbeat=10, on_change=None):
+        self.db = db
+        self.node_id = node_id or gethostname()
+        self.lease_ttl = lease_ttl
+        self.heartbeat = heartbeat
+        self.on_change = on_change
+        self.nodes = ()
+        self.gained = False
+        self.lease = None
+        self.greenlet = None
+
+    def start(self):
+        if self.greenlet is None:
+            self.greenlet = spawn(self.run)
+
+    def stop(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+        if self.lease:
+            self.lease['expires'] = 0
+            try:
+                self.db.save(self.lease)
+            except Exception:
+                pass
+            self.lease = None
+
+    def run(self):
+        while True:
+            try:
+                self.renew()
+                self.refresh()
+            except Exception as e:
+                LOGGER.warning("Error on renewing node lease: {}".format(repr(e)),
+                               extra={'MESSAGE_ID': 'error_cluster_lease'})
+            sleep(self.heartbeat)
+
+    def renew(self):
+        lease = self.lease or self.db.get(NODE_PREFIX + self.node_id, {'_id': NODE_PREFIX + self.node_id})
+        lease['expires'] = time() + self.lease_ttl
+        try:
+            self.db.save(lease)
+        except ResourceConflict:
+            self.lease = None
+            raise
+        self.lease = lease
+
+    def refresh(self):
+        now = time()
+        nodes = tuple(sorted([
+            row.id[len(NODE_PREFIX):]
+            for row in self.db.view('_all_docs', startkey=NODE_PREFIX, endkey=NODE_PREFIX + u'\ufff0', include_docs=True)
+            if row.doc and row.doc.get('expires', 0) > now
+        ]))
+        if nodes != self.nodes:
+            LOGGER.info("Cluster nodes changed: {}".format(', '.join(nodes)),
+                        extra={'MESSAGE_ID': 'cluster_changed'})
+            self.gained = self.gains(nodes)
+            self.nodes = nodes
+            if self.on_change:
+                self.on_change(self)
+
+    def gains(self, nodes):
+        """Whether this node owns tenders under nodes it did not own before.
+
+        Without known nodes it owned every tender. Otherwise rendezvous
+        hashing moves tenders to it only when it joins or others leave.
+        """
+        if not self.nodes or self.node_id not in nodes:
+            return False
+        return self.node_id not in self.nodes or bool(set(self.nodes) - set(nodes))
+
+    def owner(self, tender_id):
+        if not self.nodes:
+            return self.node_id
+        return max(self.nodes, key=lambda node_id: node_weight(node_id, tender_id))
+
+    def owns(self, tender_id):
+        return self.owner(tender_id) == self.node_id
@@ -22,7 +22,7 @@ SECURITY = {
 }
 VALIDATE_DOC_ID = '_design/_auth'
 VALIDATE_DOC_UPDATE = """function(newDoc, oldDoc, userCtx){
-    if(newDoc._deleted) {
+    if(newDoc._deleted && newDoc._id.indexOf('job_') !== 0) {
         throw({forbidden: 'Not authorized to delete this document'});
     }
     if(userCtx.roles.indexOf('_admin') !== -1 && newDoc.indexOf('_design/') === 0) {
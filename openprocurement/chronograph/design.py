@@ -5,6 +5,11 @@ from couchdb.design import ViewDefinition
 def sync_design(db):
     views = [j for i, j in globals().items() if "_view" in i]
     ViewDefinition.sync_many(db, views)
+    for design, filters in FILTERS.items():
+        doc = db.get('_design/' + design, {'_id': '_design/' + design})
+        if doc.get('filters') != filters:
+            doc['filters'] = filters
+            db.save(doc)
 
 
 plan_tenders_view = ViewDefinition('plan', 'tenders', '''function(doc) {
@@ -23,3 +28,53 @@ plan_tenders_view = ViewDefinition('plan', 'tenders', '''function(doc) {
         };
     }
 }''')
+
+
+plan_tender_ids_view = ViewDefinition('plan', 'tender_ids', '''function(doc) {
+    if(doc.streams) {
+        for (var i in doc) {
+            if (i.indexOf('stream_') == 0) {
+                for (var t in doc[i]) {
+                    if (!doc[i][t]) {
+                        continue;
+                    }
+                    var x = doc[i][t].split('_')
+                    emit(x[0], [x.length == 2 ? x[1] : null, doc._id.split('_')[1] + 'T' + t]);
+                }
+            }
+        };
+    }
+}''')
+
+
+jobs_next_run_time_view = ViewDefinition('jobs', 'next_run_time', '''function(doc) {
+    if(doc._id.indexOf('job_') == 0 && doc.next_run_time !== null) {
+        emit(doc.next_run_time, null);
+    }
+}''')
+
+
+jobs_ids_view = ViewDefinition('jobs', 'ids', '''function(doc) {
+    if(doc._id.indexOf('job_') == 0) {
+        emit(doc._id, doc.next_run_time);
+    }
+}''')
+
+
+jobs_summary_view = ViewDefinition('jobs', 'summary', '''function(doc) {
+    if(doc._id.indexOf('job_') == 0) {
+        var id = doc._id.substring(4);
+        var kind = id.indexOf('recheck_') == 0 ? 'recheck' : (id == 'resync_all' || id == 'resync_back') ? id : 'resync';
+        emit([kind, doc.next_run_time === null ? null : Math.floor(doc.next_run_time / 3600)], null);
+    }
+}''', '_count')
+
+
+FILTERS = {
+    'plan': {
+        'index': '''function(doc, req) {
+    var watch = req.query.watch ? req.query.watch.split(',') : [];
+    return doc._id.indexOf('plan') == 0 || watch.indexOf(doc._id) != -1;
+}''',
+    },
+}
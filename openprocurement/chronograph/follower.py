@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from gevent import sleep, spawn
+from gevent.lock import Semaphore
+from logging import getLogger
+from openprocurement.chronograph.scheduler import JobRequest, get_sync, sync_forward
+
+LOGGER = getLogger(__name__)
+
+
+class FeedFollower(object):
+    """Follows the tenders feed forward in one long-lived greenlet.
+
+    Replaces the `resync_all` job: new tenders are scheduled as soon as a
+    poll of the forward feed cursor finds them. Polls are `min_delay`
+    seconds apart while the feed has changes and back off exponentially
+    up to `max_delay` seconds while it is idle or failing.
+    """
+
+    def __init__(self, registry, min_delay=1, max_delay=30):
+        self.registry = registry
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.url = None
+        self.delay = min_delay
+        self.lock = Semaphore()
+        self.greenlet = None
+
+    def start(self):
+        if self.greenlet is None:
+            scheduler = self.registry.scheduler
+            if scheduler.get_job('resync_all'):
+                scheduler.remove_job('resync_all')
+            self.greenlet = spawn(self.run)
+
+    def stop(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+
+    def run(self):
+        while True:
+            try:
+                delay = self.poll()
+            except Exception as e:
+                LOGGER.warning("Error on following feed: {}".format(repr(e)),
+                               extra={'MESSAGE_ID': 'error_follow_feed'})
+                delay = self.max_delay
+            sleep(delay)
+
+    def poll(self):
+        """Process new feed pages and return the delay until the next poll.
+        Polls run one at a time, so `/resync_all` can poll too."""
+        with self.lock:
+            if self.url is None:
+                self.url = get_sync(self.registry.db, self.registry.sync_id).get('forward', {}).get('url', '')
+            request = JobRequest(self.registry, 'follow', {'url': self.url} if self.url else {})
+            state = sync_forward(request, self.url)
+            self.url = state['url']
+            if state['error']:
+                LOGGER.error("Error on following feed: {}".format(repr(state['error'])),
+                             extra={'MESSAGE_ID': 'error_follow_feed'})
+            if state['tenders'] and not state['error']:
+                self.delay = self.min_delay
+            else:
+                self.delay = min(self.delay * 2, self.max_delay)
+            return self.delay
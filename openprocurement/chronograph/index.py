@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+from copy import deepcopy
+from couchdb.http import ResourceNotFound
+from datetime import datetime
+from gevent import sleep, spawn
+from logging import getLogger
+from pytz import timezone
+
+LOGGER = getLogger(__name__)
+TZ = timezone(os.environ['TZ'] if 'TZ' in os.environ else 'Europe/Kiev')
+PLAN_PREFIX = 'plan'
+PLAN_FILTER = 'plan/index'
+
+
+def rev_number(doc):
+    return int(doc.get('_rev', '0-').split('-')[0])
+
+
+class PlanIndex(object):
+    """In-process index of plan documents.
+
+    Plans are kept per mode and day (by `plan{mode}_{date}` id), together
+    with the `watch` documents (calendar and streams), and refreshed from
+    the CouchDB `_changes` feed filtered by `plan/index` to those documents.
+    Plans of days before today are not kept. CouchDB stays the source of
+    truth: callers get copies of cached documents and save them with the
+    usual revision check, invalidating the entry on `ResourceConflict`.
+    """
+
+    def __init__(self, db, heartbeat=10000, retry_delay=5, watch=()):
+        self.db = db
+        self.watch = set(watch)
+        self.heartbeat = heartbeat
+        self.retry_delay = retry_delay
+        self.plans = {}
+        self.full = {}
+        self.seq = None
+        self.today = None
+        self.ready = False
+        self.follower = None
+
+    def start(self):
+        if self.follower is None:
+            self.follower = spawn(self.follow)
+
+    def stop(self):
+        if self.follower is not None:
+            self.follower.kill()
+            self.follower = None
+        self.ready = False
+
+    def load(self):
+        self.seq = self.db.info()['update_seq']
+        self.prune()
+        for row in self.db.view('_all_docs', startkey=PLAN_PREFIX, endkey=PLAN_PREFIX + u'\ufff0', include_docs=True):
+            self.update(row.doc)
+        if self.watch:
+            for row in self.db.view('_all_docs', keys=list(self.watch), include_docs=True):
+                if row.doc:
+                    self.update(row.doc)
+        self.ready = True
+        LOGGER.info("Plan index loaded with {} plans".format(len(self.plans)),
+                    extra={'MESSAGE_ID': 'plan_index_loaded'})
+
+    def follow(self):
+        while True:
+            try:
+                if self.seq is None:
+                    self.load()
+                for change in self.db.changes(feed='continuous', since=self.seq, include_docs=True,
+                                              heartbeat=self.heartbeat, filter=PLAN_FILTER,
+                                              watch=','.join(sorted(self.watch))):
+                    self.prune()
+                    if 'seq' not in change:
+                        continue
+                    self.seq = change['seq']
+                    if not change['id'].startswith(PLAN_PREFIX) and change['id'] not in self.watch:
+                        continue
+                    if change.get('deleted'):
+                        self.plans.pop(change['id'], None)
+                        self.full.pop(change['id'], None)
+                    elif change.get('doc'):
+                        self.update(change['doc'])
+            except ResourceNotFound:
+                LOGGER.info("Plan index stopped: database not found",
+                            extra={'MESSAGE_ID': 'plan_index_stopped'})
+                self.ready = False
+                self.follower = None
+                return
+            except Exception as e:
+                LOGGER.warning("Error on following plan changes: {}".format(repr(e)),
+                               extra={'MESSAGE_ID': 'error_plan_index'})
+                sleep(self.retry_delay)
+
+    def get(self, plan_id):
+        """Return a copy of the cached plan or None if the index is not ready
+        or the plan is of a past day."""
+        if not self.ready or self.past(plan_id):
+            return None
+        plan = self.plans.get(plan_id)
+        return deepcopy(plan) if plan else {'_id': plan_id}
+
+    def update(self, plan):
+        if plan.get('_deleted') or self.past(plan['_id']):
+            return
+        current = self.plans.get(plan['_id'])
+        if current is None or rev_number(plan) >= rev_number(current):
+            self.plans[plan['_id']] = deepcopy(plan)
+
+    def past(self, plan_id):
+        """Whether plan_id is a plan of a day before today."""
+        return plan_id not in self.watch and plan_id.startswith(PLAN_PREFIX) and \
+            self.today is not None and plan_id.rsplit('_', 1)[-1] < self.today
+
+    def prune(self):
+        """Drop the plans of past days once the day changed."""
+        today = datetime.now(TZ).date().isoformat()
+        if today == self.today:
+            return
+        self.today = today
+        for plan_id in [i for i in self.plans if self.past(i)]:
+            del self.plans[plan_id]
+            self.full.pop(plan_id, None)
+
+    def invalidate(self, plan_id):
+        self.plans.pop(plan_id, None)
+        self.full.pop(plan_id, None)
+        plan = self.db.get(plan_id)
+        if plan:
+            self.update(plan)
+
+    def is_full(self, plan_id, streams):
+        """O(1) check of a day previously found full for the given streams count."""
+        plan = self.plans.get(plan_id)
+        return bool(plan) and self.full.get(plan_id) == (plan.get('_rev'), streams)
+
+    def mark_full(self, plan, streams):
+        if plan.get('_rev'):
+            self.full[plan['_id']] = (plan['_rev'], streams)
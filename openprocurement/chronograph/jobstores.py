@@ -0,0 +1,677 @@
+# -*- coding: utf-8 -*-
+import os
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore as BaseSQLAlchemyJobStore
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+from base64 import b64decode, b64encode
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from couchdb.http import ResourceConflict, ResourceNotFound
+from datetime import datetime, timedelta
+from gevent import sleep, spawn
+from heapq import merge
+from openprocurement.chronograph.design import jobs_ids_view, jobs_next_run_time_view, jobs_summary_view
+from openprocurement.chronograph.wheel import TimerWheel
+from pytz import timezone, utc
+from sqlalchemy import Integer, bindparam, case, cast, func, select
+from sqlalchemy.exc import IntegrityError
+from time import time
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: nocover
+    import pickle
+
+CHUNK_SIZE = 500
+JOB_PREFIX = 'job_'
+JOB_KINDS = ('recheck', 'resync', 'resync_all', 'resync_back')
+SUMMARY_BUCKET = 3600
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+
+class BatchJobStoreMixin(object):
+    """Buffers added and updated jobs of a job store inside `batch()`.
+
+    The buffered jobs are written with the store's `upsert_jobs` when the
+    batch ends without an error and dropped otherwise. Jobs are upserted,
+    so `add_job` does not raise `ConflictingIdError` there.
+    """
+
+    _batch = None
+
+    @contextmanager
+    def batch(self):
+        if self._batch is not None:
+            yield
+            return
+        self._batch = OrderedDict()
+        try:
+            yield
+        except BaseException:
+            self._batch = None
+            raise
+        jobs, self._batch = self._batch.values(), None
+        self.upsert_jobs(jobs)
+
+    def lookup_job(self, job_id):
+        if self._batch and job_id in self._batch:
+            return self._batch[job_id]
+        return super(BatchJobStoreMixin, self).lookup_job(job_id)
+
+    def lookup_jobs(self, job_ids):
+        """Return a dict of job id -> job for the stored ones of job_ids."""
+        jobs = self._lookup_jobs(job_ids)
+        if self._batch:
+            jobs.update([(i, self._batch[i]) for i in job_ids if i in self._batch])
+        return jobs
+
+    def add_job(self, job):
+        if self._batch is not None:
+            self._batch[job.id] = job
+        else:
+            super(BatchJobStoreMixin, self).add_job(job)
+
+    def update_job(self, job):
+        if self._batch is not None:
+            self._batch[job.id] = job
+        else:
+            super(BatchJobStoreMixin, self).update_job(job)
+
+    def remove_job(self, job_id):
+        batched = self._batch and self._batch.pop(job_id, None)
+        try:
+            super(BatchJobStoreMixin, self).remove_job(job_id)
+        except JobLookupError:
+            if not batched:
+                raise
+
+
+def job_kind(job_id):
+    if job_id.startswith('recheck_'):
+        return 'recheck'
+    if job_id in ('resync_all', 'resync_back'):
+        return job_id
+    return 'resync'
+
+
+def id_range(kind, prefix=''):
+    """Return [low, high) bounds of job ids of kind with a tender id prefix."""
+    if kind == 'recheck':
+        return 'recheck_' + prefix, 'recheck_' + prefix + u'\ufff0'
+    if kind == 'resync':
+        return prefix, prefix + u'\ufff0'
+    return kind, kind + u'\ufff0'
+
+
+def job_unchanged(job, next_run_time, job_state):
+    """Whether a stored job has the same next run time and args as job."""
+    return next_run_time == datetime_to_utc_timestamp(job.next_run_time) and \
+        pickle.loads(job_state)['args'] == tuple(job.args)
+
+
+class SQLAlchemyJobStore(BatchJobStoreMixin, BaseSQLAlchemyJobStore):
+    """SQLAlchemy job store with bulk lookups and buffered writes."""
+
+    def _lookup_jobs(self, job_ids):
+        return dict([
+            (job_id, self._reconstitute_job(job_state))
+            for job_id, job_state in self._get_states(job_ids, self.jobs_t.c.job_state)
+        ])
+
+    def upsert_jobs(self, jobs):
+        """Insert or update jobs in one transaction.
+
+        Jobs stored with the same next run time and args are skipped. When
+        another writer inserted some of the jobs meanwhile, the transaction
+        is run again with those jobs as updates.
+        """
+        while True:
+            stored = dict([
+                (job_id, (next_run_time, job_state))
+                for job_id, next_run_time, job_state in self._get_states(
+                    [job.id for job in jobs], self.jobs_t.c.next_run_time, self.jobs_t.c.job_state)
+            ])
+            inserts, updates = [], []
+            for job in jobs:
+                if job.id in stored and job_unchanged(job, *stored[job.id]):
+                    continue
+                row = {
+                    'next_run_time': datetime_to_utc_timestamp(job.next_run_time),
+                    'job_state': pickle.dumps(job.__getstate__(), self.pickle_protocol)
+                }
+                if job.id in stored:
+                    row['job_id'] = job.id
+                    updates.append(row)
+                else:
+                    row['id'] = job.id
+                    inserts.append(row)
+            if not inserts and not updates:
+                return 0
+            try:
+                with self.engine.begin() as connection:
+                    if inserts:
+                        connection.execute(self.jobs_t.insert(), inserts)
+                    if updates:
+                        connection.execute(self.jobs_t.update().where(self.jobs_t.c.id == bindparam('job_id')), updates)
+            except IntegrityError:
+                continue
+            return len(inserts) + len(updates)
+
+    def get_job_times(self, low, high, after=None, limit=CHUNK_SIZE):
+        """Return (job id, next run timestamp) of jobs with ids in
+        [low, high) after the `after` id, ordered by id."""
+        c = self.jobs_t.c
+        selectable = select([c.id, c.next_run_time]).where(c.id >= low).where(c.id < high)
+        if after is not None:
+            selectable = selectable.where(c.id > after)
+        return [tuple(row) for row in self.engine.execute(selectable.order_by(c.id).limit(limit))]
+
+    def count_jobs(self):
+        """Return (kind, bucket, count) of jobs per kind and run time bucket."""
+        c = self.jobs_t.c
+        kind = case([
+            (c.id.like('recheck\\_%', escape='\\'), 'recheck'),
+            (c.id.in_(['resync_all', 'resync_back']), c.id),
+        ], else_='resync')
+        bucket = cast(c.next_run_time / SUMMARY_BUCKET, Integer)
+        selectable = select([kind, bucket, func.count()]).group_by(kind, bucket)
+        return [tuple(row) for row in self.engine.execute(selectable)]
+
+    def _get_states(self, job_ids, *columns):
+        job_ids = list(job_ids)
+        rows = []
+        for i in range(0, len(job_ids), CHUNK_SIZE):
+            selectable = select([self.jobs_t.c.id] + list(columns)).\
+                where(self.jobs_t.c.id.in_(job_ids[i:i + CHUNK_SIZE]))
+            rows.extend(self.engine.execute(selectable))
+        return rows
+
+
+class BaseCouchDBJobStore(BaseJobStore):
+    """Stores jobs as `job_<id>` documents of the chronograph database.
+
+    Documents keep the pickled job state and its next run time, which the
+    `jobs/next_run_time` view indexes, so due jobs and the next wakeup are
+    range queries. Bulk writes go through `_bulk_docs`.
+    """
+
+    def __init__(self, db, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super(BaseCouchDBJobStore, self).__init__()
+        self.db = db
+        self.pickle_protocol = pickle_protocol
+        self._revs = {}
+
+    def lookup_job(self, job_id):
+        doc = self.db.get(JOB_PREFIX + job_id)
+        return self._reconstitute_job(doc) if doc else None
+
+    def _lookup_jobs(self, job_ids):
+        return dict([(job.id, job) for job in self._get_jobs(self._get_docs(job_ids).values())])
+
+    def get_due_jobs(self, now):
+        rows = jobs_next_run_time_view(self.db, endkey=datetime_to_utc_timestamp(now), include_docs=True)
+        return self._get_jobs([row.doc for row in rows])
+
+    def get_next_run_time(self):
+        rows = list(jobs_next_run_time_view(self.db, limit=1))
+        return utc_timestamp_to_datetime(rows[0].key) if rows else None
+
+    def get_all_jobs(self):
+        rows = self.db.view('_all_docs', startkey=JOB_PREFIX, endkey=JOB_PREFIX + u'\ufff0', include_docs=True)
+        jobs = self._get_jobs([row.doc for row in rows])
+        jobs.sort(key=lambda job: (job.next_run_time is None, job.next_run_time))
+        return jobs
+
+    def add_job(self, job):
+        doc = self._job_doc(job)
+        try:
+            self.db.save(doc)
+        except ResourceConflict:
+            raise ConflictingIdError(job.id)
+        self._revs[job.id] = doc['_rev']
+
+    def update_job(self, job):
+        while True:
+            doc = self._job_doc(job)
+            doc['_rev'] = self._revs.get(job.id) or self._get_rev(job.id)
+            try:
+                self.db.save(doc)
+            except ResourceConflict:
+                self._revs.pop(job.id, None)
+            else:
+                self._revs[job.id] = doc['_rev']
+                return
+
+    def remove_job(self, job_id):
+        while True:
+            rev = self._revs.pop(job_id, None) or self._get_rev(job_id)
+            try:
+                self.db.delete({'_id': JOB_PREFIX + job_id, '_rev': rev})
+            except ResourceNotFound:
+                raise JobLookupError(job_id)
+            except ResourceConflict:
+                continue
+            return
+
+    def get_job_times(self, low, high, after=None, limit=CHUNK_SIZE):
+        """Return (job id, next run timestamp) of jobs with ids in
+        [low, high) after the `after` id, ordered by id."""
+        options = {'endkey': JOB_PREFIX + high, 'inclusive_end': False, 'limit': limit}
+        if after is not None and after >= low:
+            options.update(startkey=JOB_PREFIX + after, skip=1)
+        else:
+            options.update(startkey=JOB_PREFIX + low)
+        return [(row.key[len(JOB_PREFIX):], row.value) for row in jobs_ids_view(self.db, **options)]
+
+    def count_jobs(self):
+        """Return (kind, bucket, count) of jobs per kind and run time bucket."""
+        return [tuple(row.key) + (row.value,) for row in jobs_summary_view(self.db, group=True)]
+
+    def remove_all_jobs(self):
+        rows = self.db.view('_all_docs', startkey=JOB_PREFIX, endkey=JOB_PREFIX + u'\ufff0')
+        docs = [{'_id': row.id, '_rev': row.value['rev'], '_deleted': True} for row in rows]
+        for i in range(0, len(docs), CHUNK_SIZE):
+            self.db.update(docs[i:i + CHUNK_SIZE])
+        self._revs.clear()
+
+    def upsert_jobs(self, jobs):
+        """Save jobs with `_bulk_docs` requests.
+
+        Jobs stored with the same next run time and args are skipped, and
+        conflicted documents are saved again with their current revision.
+        Returns the number of written jobs.
+        """
+        jobs = dict([(job.id, job) for job in jobs])
+        written = 0
+        while jobs:
+            stored = self._get_docs(jobs.keys())
+            docs = []
+            for job_id, job in jobs.items():
+                doc = self._job_doc(job)
+                if job_id in stored:
+                    stored_doc = stored[job_id]
+                    if job_unchanged(job, stored_doc['next_run_time'], b64decode(stored_doc['job_state'])):
+                        continue
+                    doc['_rev'] = stored_doc['_rev']
+                docs.append(doc)
+            conflicts = {}
+            for i in range(0, len(docs), CHUNK_SIZE):
+                for success, doc_id, rev in self.db.update(docs[i:i + CHUNK_SIZE]):
+                    job_id = doc_id[len(JOB_PREFIX):]
+                    if success:
+                        self._revs[job_id] = rev
+                        written += 1
+                    else:
+                        conflicts[job_id] = jobs[job_id]
+            jobs = conflicts
+        return written
+
+    def _job_doc(self, job):
+        return {
+            '_id': JOB_PREFIX + job.id,
+            'next_run_time': datetime_to_utc_timestamp(job.next_run_time),
+            'job_state': b64encode(pickle.dumps(job.__getstate__(), self.pickle_protocol))
+        }
+
+    def _get_rev(self, job_id):
+        doc = self.db.get(JOB_PREFIX + job_id)
+        if doc is None:
+            raise JobLookupError(job_id)
+        return doc['_rev']
+
+    def _get_docs(self, job_ids):
+        job_ids = list(job_ids)
+        docs = {}
+        for i in range(0, len(job_ids), CHUNK_SIZE):
+            keys = [JOB_PREFIX + job_id for job_id in job_ids[i:i + CHUNK_SIZE]]
+            for row in self.db.view('_all_docs', keys=keys, include_docs=True):
+                if row.doc:
+                    docs[row.key[len(JOB_PREFIX):]] = row.doc
+        return docs
+
+    def _reconstitute_job(self, doc):
+        job_state = pickle.loads(b64decode(doc['job_state']))
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        self._revs[job.id] = doc['_rev']
+        return job
+
+    def _get_jobs(self, docs):
+        jobs = []
+        failed = []
+        for doc in docs:
+            if not doc:
+                continue
+            try:
+                jobs.append(self._reconstitute_job(doc))
+            except BaseException:
+                self._logger.exception('Unable to restore job "%s" -- removing it', doc['_id'])
+                failed.append({'_id': doc['_id'], '_rev': doc['_rev'], '_deleted': True})
+        if failed:
+            self.db.update(failed)
+        return jobs
+
+    def __repr__(self):
+        return '<%s (db=%s)>' % (self.__class__.__name__, self.db.name)
+
+
+class CouchDBJobStore(BatchJobStoreMixin, BaseCouchDBJobStore):
+    """CouchDB job store with bulk lookups and buffered writes."""
+
+
+class JobRecord(object):
+    """Compact state of a job with a date trigger and no kwargs.
+
+    Keeps the job id, args and run time (microseconds since the epoch).
+    The options shared by many jobs (function, executor, name, misfire
+    grace time, coalesce, max instances and time zone) are one interned
+    template tuple.
+    """
+
+    __slots__ = ('id', 'args', 'run_time', 'template')
+
+    def __init__(self, job_id, args, run_time, template):
+        self.id = job_id
+        self.args = args
+        self.run_time = run_time
+        self.template = template
+
+    @classmethod
+    def from_job(cls, job, templates):
+        """Return the record of job, or None if it has no compact form."""
+        run_date = job.next_run_time
+        zone = getattr(run_date and run_date.tzinfo, 'zone', None)
+        if job.kwargs or not isinstance(job.trigger, DateTrigger) or job.trigger.run_date != run_date or zone is None:
+            return None
+        template = (job.func_ref, job.executor, job.name, job.misfire_grace_time, job.coalesce, job.max_instances, zone)
+        delta = run_date - EPOCH
+        run_time = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+        return cls(job.id, tuple(job.args), run_time, templates.setdefault(template, template))
+
+    @property
+    def timestamp(self):
+        return self.run_time / 1000000.
+
+    def job_state(self):
+        func, executor, name, misfire_grace_time, coalesce, max_instances, zone = self.template
+        tz = timezone(zone)
+        run_date = (EPOCH + timedelta(microseconds=self.run_time)).astimezone(tz)
+        return {
+            'version': 1,
+            'id': self.id,
+            'func': func,
+            'trigger': DateTrigger(run_date, tz),
+            'executor': executor,
+            'args': self.args,
+            'kwargs': {},
+            'name': name,
+            'misfire_grace_time': misfire_grace_time,
+            'coalesce': coalesce,
+            'max_instances': max_instances,
+            'next_run_time': run_date,
+        }
+
+
+class TimerWheelJobStore(BaseJobStore):
+    """Keeps jobs in memory on a hierarchical timer wheel.
+
+    Adding, replacing and removing a job is O(1) and due jobs are taken a
+    whole second at a time, instead of the sorted list of MemoryJobStore.
+    Jobs run on whole seconds. Date jobs are kept as `JobRecord`s and
+    turned back into jobs when looked up or due. With a `path`, the jobs
+    are loaded from a snapshot file at start and written back to it every
+    `snapshot_interval` seconds when they changed and at shutdown.
+    """
+
+    def __init__(self, path=None, snapshot_interval=60, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super(TimerWheelJobStore, self).__init__()
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.pickle_protocol = pickle_protocol
+        self.wheel = TimerWheel(time())
+        self._templates = {}
+        self._paused = {}
+        self._changed = False
+        self._greenlet = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def start(self, scheduler, alias):
+        super(TimerWheelJobStore, self).start(scheduler, alias)
+        for job in self.wheel.values.values() + self._paused.values():
+            if isinstance(job, Job):
+                job._scheduler = scheduler
+                job._jobstore_alias = alias
+        if self.path and self._greenlet is None:
+            self._greenlet = spawn(self._run)
+
+    def shutdown(self):
+        if self._greenlet is not None:
+            self._greenlet.kill()
+            self._greenlet = None
+        if self.path and self._changed:
+            self.snapshot()
+
+    def lookup_job(self, job_id):
+        value = self.wheel.get(job_id) or self._paused.get(job_id)
+        return value and self._get_job(value)
+
+    def lookup_jobs(self, job_ids):
+        """Return a dict of job id -> job for the stored ones of job_ids."""
+        jobs = [self.lookup_job(job_id) for job_id in job_ids]
+        return dict([(job.id, job) for job in jobs if job])
+
+    def get_due_jobs(self, now):
+        due = self.wheel.advance(datetime_to_utc_timestamp(now))
+        values = self.wheel.values
+        jobs = [self._get_job(values[job_id]) for job_id in due]
+        return sorted(jobs, key=lambda job: job.next_run_time)
+
+    def get_next_run_time(self):
+        next_time = self.wheel.next_time()
+        return utc_timestamp_to_datetime(next_time) if next_time is not None else None
+
+    def get_all_jobs(self):
+        jobs = sorted([self._get_job(i) for i in self.wheel.values.itervalues()], key=lambda job: job.next_run_time)
+        return jobs + self._paused.values()
+
+    def add_job(self, job):
+        if job.id in self.wheel or job.id in self._paused:
+            raise ConflictingIdError(job.id)
+        self._add(job)
+
+    def update_job(self, job):
+        self.remove_job(job.id)
+        self._add(job)
+
+    def remove_job(self, job_id):
+        if job_id in self.wheel:
+            self.wheel.remove(job_id)
+        elif self._paused.pop(job_id, None) is None:
+            raise JobLookupError(job_id)
+        self._changed = True
+
+    def remove_all_jobs(self):
+        self.wheel = TimerWheel(time())
+        self._templates.clear()
+        self._paused.clear()
+        self._changed = True
+
+    def snapshot(self):
+        """Write the records and the states of other jobs to the snapshot
+        file."""
+        templates = {}
+        records = []
+        states = [job.__getstate__() for job in self._paused.values()]
+        for value in self.wheel.values.itervalues():
+            if isinstance(value, JobRecord):
+                template = templates.setdefault(value.template, len(templates))
+                records.append((value.id, value.args, value.run_time, template))
+            else:
+                states.append(value.__getstate__())
+        templates = [i for i, _ in sorted(templates.items(), key=lambda i: i[1])]
+        self._changed = False
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'templates': templates, 'records': records, 'states': states}, f, self.pickle_protocol)
+        os.rename(tmp, self.path)
+
+    def load(self):
+        """Add the jobs of the snapshot file."""
+        with open(self.path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if isinstance(snapshot, list):
+            snapshot = {'templates': [], 'records': [], 'states': snapshot}
+        templates = [self._templates.setdefault(i, i) for i in snapshot['templates']]
+        for job_id, args, run_time, template in snapshot['records']:
+            record = JobRecord(job_id, args, run_time, templates[template])
+            self.wheel.add(job_id, record.timestamp, record)
+        for job_state in snapshot['states']:
+            try:
+                job = Job.__new__(Job)
+                job.__setstate__(job_state)
+            except BaseException:
+                self._logger.exception('Unable to restore job "%s" -- removing it', job_state.get('id'))
+                continue
+            self._add(job)
+        self._changed = False
+
+    def _add(self, job):
+        if job.next_run_time is None:
+            self._paused[job.id] = job
+        else:
+            value = JobRecord.from_job(job, self._templates) or job
+            self.wheel.add(job.id, datetime_to_utc_timestamp(job.next_run_time), value)
+        self._changed = True
+
+    def _get_job(self, value):
+        if not isinstance(value, JobRecord):
+            return value
+        job = Job.__new__(Job)
+        job.__setstate__(value.job_state())
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _run(self):
+        while True:
+            sleep(self.snapshot_interval)
+            if self._changed:
+                try:
+                    self.snapshot()
+                except Exception:
+                    self._logger.exception('Unable to write the jobs snapshot to "%s"', self.path)
+
+    def __repr__(self):
+        return '<%s (path=%s)>' % (self.__class__.__name__, self.path)
+
+
+def get_jobstore(scheduler, jobstore='default'):
+    try:
+        return scheduler._lookup_jobstore(jobstore)
+    except KeyError:
+        return None
+
+
+def lookup_jobs(scheduler, job_ids, jobstore='default'):
+    """Return a dict of job id -> job with one jobstore query if supported."""
+    store = get_jobstore(scheduler, jobstore)
+    if scheduler.running and hasattr(store, 'lookup_jobs'):
+        return store.lookup_jobs(job_ids)
+    jobs = [scheduler.get_job(job_id) for job_id in job_ids]
+    return dict([(job.id, job) for job in jobs if job])
+
+
+@contextmanager
+def batch_jobs(scheduler, jobstore='default'):
+    """Buffer jobs added to the scheduler and write them at once on exit."""
+    store = get_jobstore(scheduler, jobstore)
+    if not scheduler.running or not hasattr(store, 'batch'):
+        yield
+        return
+    with store.batch():
+        yield
+    scheduler.wakeup()
+
+
+def memory_job_times(scheduler):
+    """Return a `get_job_times` over a sorted copy of the scheduler jobs.
+
+    Stores without id ranges (like the default memory store) keep no id
+    index, so every call lists and sorts all of their jobs once.
+    """
+    jobs = sorted([(job.id, datetime_to_utc_timestamp(getattr(job, 'next_run_time', None))) for job in scheduler.get_jobs()])
+    job_ids = [i[0] for i in jobs]
+
+    def get_job_times(low, high, after=None, limit=CHUNK_SIZE):
+        first = bisect_right(job_ids, after) if after is not None and after >= low else bisect_left(job_ids, low)
+        return jobs[first:min(bisect_left(job_ids, high), first + limit)]
+    return get_job_times
+
+
+def iter_kind_jobs(get_job_times, kind, prefix, after):
+    """Yield (job id, next run timestamp) of jobs of kind ordered by id."""
+    low, high = id_range(kind, prefix)
+    if after is not None and after >= high:
+        return
+    while True:
+        rows = get_job_times(low, high, after, CHUNK_SIZE)
+        for row in rows:
+            if job_kind(row[0]) == kind:
+                yield row
+        if len(rows) < CHUNK_SIZE:
+            return
+        after = rows[-1][0]
+
+
+def iter_jobs(scheduler, kind=None, prefix='', start=None, end=None, after=None, jobstore='default'):
+    """Yield (job id, next run time) ordered by id, filtered by job kind,
+    tender id prefix and a [start, end) run time window.
+
+    Jobs are read from the job store in chunks when it supports id ranges,
+    otherwise all jobs are listed and sorted on every call. The
+    `resync_all` and `resync_back` jobs have no tender id, so a prefix
+    skips them.
+    """
+    store = get_jobstore(scheduler, jobstore)
+    start = start and datetime_to_utc_timestamp(start)
+    end = end and datetime_to_utc_timestamp(end)
+    if not scheduler.running or not hasattr(store, 'get_job_times'):
+        get_job_times = memory_job_times(scheduler)
+    else:
+        get_job_times = store.get_job_times
+    kinds = [i for i in ([kind] if kind else JOB_KINDS) if not prefix or i in ('recheck', 'resync')]
+    for job_id, next_run_time in merge(*[iter_kind_jobs(get_job_times, i, prefix, after) for i in kinds]):
+        if start and (next_run_time is None or next_run_time < start):
+            continue
+        if end and (next_run_time is None or next_run_time >= end):
+            continue
+        yield job_id, next_run_time and utc_timestamp_to_datetime(next_run_time)
+
+
+def summarize_jobs(scheduler, jobstore='default'):
+    """Return counts of jobs per kind and per hour of next run time."""
+    store = get_jobstore(scheduler, jobstore)
+    if scheduler.running and hasattr(store, 'count_jobs'):
+        counts = store.count_jobs()
+    else:
+        counts = {}
+        for job in scheduler.get_jobs():
+            next_run_time = datetime_to_utc_timestamp(getattr(job, 'next_run_time', None))
+            key = (job_kind(job.id), next_run_time and int(next_run_time // SUMMARY_BUCKET))
+            counts[key] = counts.get(key, 0) + 1
+        counts = [key + (count,) for key, count in counts.items()]
+    kinds, buckets = {}, {}
+    for kind, bucket, count in counts:
+        kinds[kind] = kinds.get(kind, 0) + count
+        if bucket is not None:
+            buckets[bucket] = buckets.get(bucket, 0) + count
+    return kinds, sorted([
+        (utc_timestamp_to_datetime(bucket * SUMMARY_BUCKET), count)
+        for bucket, count in buckets.items()
+    ])
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from apscheduler.executors.gevent import GeventExecutor
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from openprocurement.chronograph.jobstores import job_kind
+from pytz import utc
+from timeit import default_timer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600)
+DAYS_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+
+def format_labels(names, values, extra=()):
+    pairs = zip(names, values) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(['{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in pairs]) + '}'
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def key(self, labels):
+        return tuple([labels.get(i, '') for i in self.labels])
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for name, labels, extra, value in self.samples():
+            lines.append('{}{} {}'.format(name, format_labels(self.labels, labels, extra), repr(float(value))))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, (), value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, (), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        if key not in self.values:
+            self.values[key] = [[0] * (len(self.buckets) + 1), 0]
+        counts = self.values[key]
+        counts[0][bisect_left(self.buckets, value)] += 1
+        counts[1] += value
+
+    def samples(self):
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield self.name + '_bucket', key, (('le', bound),), cumulative
+            yield self.name + '_sum', key, (), total
+            yield self.name + '_count', key, (), cumulative
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = default_timer()
+    yield
+    histogram.observe(default_timer() - start, **labels)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join([metric.render() for metric in self.metrics]) + '\n'
+
+
+REGISTRY = Registry()
+JOB_LAG = REGISTRY.register(Histogram(
+    'chronograph_job_fire_lag_seconds', 'Delay between scheduled and actual job run time.', ['kind'], LAG_BUCKETS))
+JOBS_FIRED = REGISTRY.register(Counter(
+    'chronograph_jobs_fired_total', 'Jobs submitted for execution.', ['kind']))
+JOBS = REGISTRY.register(Gauge(
+    'chronograph_jobs', 'Jobs in the job store.', ['kind']))
+JOBS_DUE = REGISTRY.register(Gauge(
+    'chronograph_jobs_due_per_minute', 'Upcoming job fires per minute over the next window seconds.', ['window']))
+PLANNING_TIME = REGISTRY.register(Histogram(
+    'chronograph_planning_seconds', 'Auction planning latency.'))
+PLANNING_DAYS = REGISTRY.register(Histogram(
+    'chronograph_planning_skipped_days', 'Full days skipped when planning an auction.', (), DAYS_BUCKETS))
+PLAN_CONFLICTS = REGISTRY.register(Counter(
+    'chronograph_plan_conflicts_total', 'Plan document saves retried after ResourceConflict.'))
+API_LATENCY = REGISTRY.register(Histogram(
+    'chronograph_api_request_seconds', 'Tenders API request latency.', ['method', 'status']))
+PUSH_ATTEMPTS = REGISTRY.register(Counter(
+    'chronograph_push_attempts_total', 'Job callback attempts by result.', ['result']))
+
+
+class MeteredGeventExecutor(GeventExecutor):
+    """Gevent executor recording fire lag of submitted jobs."""
+
+    def _do_submit_job(self, job, run_times):
+        now = datetime.now(utc)
+        kind = job_kind(job.id)
+        for run_time in run_times:
+            JOB_LAG.observe(max((now - run_time).total_seconds(), 0), kind=kind)
+        JOBS_FIRED.inc(kind=kind)
+        return super(MeteredGeventExecutor, self)._do_submit_job(job, run_times)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import requests
+from contextlib import contextmanager
+from gevent import sleep
+from gevent.lock import BoundedSemaphore
+from openprocurement.chronograph.metrics import API_LATENCY
+from time import time
+from timeit import default_timer
+from urlparse import urlparse
+
+
+class TokenBucket(object):
+    """Allows `rate` acquisitions per second with bursts of `burst`.
+
+    A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate=0, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            sleep((1 - self.tokens) / self.rate)
+
+
+class Outbound(object):
+    """HTTP layer for requests to the tenders API.
+
+    Requests to a host run at most `concurrency` at a time and start at
+    most `rate` times per second (bursts of `burst`) over a session with
+    `pool_size` connections per host.
+    """
+
+    options = (
+        ('concurrency', int),
+        ('rate', float),
+        ('burst', int),
+        ('pool_size', int),
+    )
+
+    def __init__(self, concurrency=10, rate=0, burst=10, pool_size=10):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.hosts = {}
+        self.mount()
+
+    def configure(self, settings, prefix='outbound.'):
+        for name, cast in self.options:
+            if prefix + name in settings:
+                setattr(self, name, cast(settings[prefix + name]))
+        self.hosts = {}
+        self.mount()
+
+    def mount(self):
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @contextmanager
+    def limit(self, url):
+        host = urlparse(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = (BoundedSemaphore(self.concurrency), TokenBucket(self.rate, self.burst))
+        semaphore, bucket = self.hosts[host]
+        with semaphore:
+            bucket.acquire()
+            yield
+
+    def request(self, method, url, **kwargs):
+        with self.limit(url):
+            start, status = default_timer(), 'error'
+            try:
+                response = self.session.request(method, url, **kwargs)
+                status = response.status_code
+            finally:
+                API_LATENCY.observe(default_timer() - start, method=method, status=status)
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
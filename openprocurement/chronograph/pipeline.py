@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from gevent import joinall, killall, spawn
+from gevent.queue import Queue
+
+STOP = object()
+
+
+def run_pipeline(source, stages, size=2):
+    """Run source and stages in their own greenlets.
+
+    Items from source pass through stages in order over bounded queues of
+    `size` items, so a slow stage holds back the ones before it. A stage
+    returning None drops the item. The first error kills the pipeline and
+    is raised to the caller.
+    """
+    queues = [Queue(size) for _ in stages]
+
+    def produce():
+        for item in source:
+            queues[0].put(item)
+        queues[0].put(STOP)
+
+    def consume(stage, inbox, outbox):
+        for item in iter(inbox.get, STOP):
+            item = stage(item)
+            if outbox is not None and item is not None:
+                outbox.put(item)
+        if outbox is not None:
+            outbox.put(STOP)
+
+    greenlets = [spawn(produce)] + [
+        spawn(consume, stage, queues[i], queues[i + 1] if i + 1 < len(queues) else None)
+        for i, stage in enumerate(stages)
+    ]
+    try:
+        joinall(greenlets, raise_error=True)
+    finally:
+        killall(greenlets)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+from couchdb.http import ResourceConflict
+from datetime import timedelta
+from gevent import sleep, spawn
+from gevent.event import AsyncResult
+from gevent.queue import Empty, Queue
+from logging import getLogger
+from openprocurement.chronograph.scheduler import (
+    book_slot,
+    calc_auction_end_time,
+    find_day_slot,
+    get_first_date,
+    get_plan,
+    get_plan_id,
+    get_streams,
+    get_working_days,
+    release_slot,
+    save_plan,
+)
+from random import random
+
+LOGGER = getLogger(__name__)
+
+
+class Booking(object):
+
+    def __init__(self, mode, tender_id, date, calendar, streams):
+        self.mode = mode
+        self.tender_id = tender_id
+        self.date = date
+        self.calendar = calendar
+        self.streams = streams
+        self.skipped_days = 0
+        self.result = AsyncResult()
+
+
+class Release(object):
+
+    def __init__(self, plan_id, slot, tender_id):
+        self.plan_id = plan_id
+        self.slot = slot
+        self.tender_id = tender_id
+        self.result = AsyncResult()
+
+
+class DayWorker(object):
+    """Single writer of one plan document.
+
+    Bookings and releases queued for the day are drained in batches,
+    applied to one copy of the plan and committed with a single save.
+    Bookings that do not fit are forwarded to the next working day.
+    """
+
+    def __init__(self, planner, plan_id):
+        self.planner = planner
+        self.plan_id = plan_id
+        self.queue = Queue()
+        self.greenlet = spawn(self.run)
+
+    def run(self):
+        while True:
+            try:
+                tasks = [self.queue.get(timeout=self.planner.idle_timeout)]
+            except Empty:
+                # a task may be submitted after the timeout fired
+                if not self.queue.empty():
+                    continue
+                if self.planner.workers.get(self.plan_id) is self:
+                    del self.planner.workers[self.plan_id]
+                return
+            while not self.queue.empty():
+                tasks.append(self.queue.get_nowait())
+            try:
+                self.process(tasks)
+            except Exception as e:
+                LOGGER.error("Error on processing plan {}: {}".format(self.plan_id, repr(e)),
+                             extra={'MESSAGE_ID': 'error_planner'})
+                for task in tasks:
+                    if not task.result.ready():
+                        task.result.set_exception(e)
+
+    def process(self, tasks):
+        planner = self.planner
+        delay = planner.min_delay
+        while True:
+            plan = get_plan(planner.db, self.plan_id, planner.index)
+            booked, forwarded, failed, changed = [], [], [], False
+            for task in tasks:
+                if isinstance(task, Release):
+                    if plan.get('streams'):
+                        try:
+                            release_slot(plan, task.slot, task.tender_id)
+                        except Exception as e:
+                            failed.append((task, e))
+                        else:
+                            changed = True
+                    continue
+                slot = find_day_slot(plan, task.date, task.streams)
+                if slot:
+                    start, end, dayStart, stream, new_slot = slot
+                    book_slot(plan, end.time(), stream, task.tender_id, dayStart, new_slot)
+                    booked.append((task, start, stream))
+                    changed = True
+                else:
+                    forwarded.append(task)
+            if not changed:
+                break
+            try:
+                save_plan(planner.db, plan, planner.index)
+            except ResourceConflict:
+                planner.conflicts += 1
+                sleep(delay * (1 + random()))
+                delay = min(delay * 2, planner.max_delay)
+            else:
+                break
+        failed = dict(failed)
+        for task in tasks:
+            if isinstance(task, Release):
+                if task in failed:
+                    task.result.set_exception(failed[task])
+                else:
+                    task.result.set(True)
+        for task, start, stream in booked:
+            task.result.set((start, stream, task.skipped_days))
+        if forwarded and planner.index:
+            planner.index.mark_full(plan, forwarded[0].streams)
+        for task in forwarded:
+            task.skipped_days += 1
+            planner.forward(task, task.date + timedelta(days=1))
+
+
+class Planner(object):
+    """Planning service with one worker greenlet per mode/day partition.
+
+    Callers block on the result of their request while the day worker
+    serializes all writes to its plan document, so concurrent jobs no longer
+    spin on `ResourceConflict`. Conflicts with other processes are retried
+    by the worker with jittered exponential backoff.
+    """
+
+    def __init__(self, db, index=None, idle_timeout=60, min_delay=0.05, max_delay=1):
+        self.db = db
+        self.index = index
+        self.idle_timeout = idle_timeout
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.workers = {}
+        self.conflicts = 0
+
+    def submit(self, plan_id, task):
+        worker = self.workers.get(plan_id)
+        if worker is None:
+            worker = self.workers[plan_id] = DayWorker(self, plan_id)
+        worker.queue.put(task)
+
+    def forward(self, booking, date):
+        date = booking.calendar.next(date)
+        plan_id = get_plan_id(booking.mode, date)
+        while self.index and self.index.is_full(plan_id, booking.streams):
+            date = booking.calendar.add(date, 1)
+            plan_id = get_plan_id(booking.mode, date)
+            booking.skipped_days += 1
+        booking.date = date
+        self.submit(plan_id, booking)
+
+    def plan(self, tender, start, quick=False, lot_id=None):
+        """Same as `planning_auction`, but the slot is booked by day workers."""
+        return self.plan_lots(tender, [(lot_id, start)], quick)[lot_id]
+
+    def plan_lots(self, tender, lots, quick=False):
+        """Same as `planning_lots`; lots booked on one day share a save."""
+        if quick:
+            return dict([(lot_id, (calc_auction_end_time(0, start), 0, 0)) for lot_id, start in lots])
+        tid = tender.get('id', '')
+        mode = tender.get('mode', '')
+        calendar = get_working_days(self.db, self.index)
+        streams = get_streams(self.db, index=self.index)
+        bookings = []
+        for lot_id, start in lots:
+            booking = Booking(mode, "_".join([tid, lot_id]) if lot_id else tid, None, calendar, streams)
+            self.forward(booking, get_first_date(start))
+            bookings.append((lot_id, booking))
+        return dict([(lot_id, booking.result.get()) for lot_id, booking in bookings])
+
+    def release(self, plan_id, plan_time, tender_id):
+        """Same as `free_slot`, applied by the worker of the plan day."""
+        return self.release_many([(plan_id, plan_time, tender_id)])[0]
+
+    def release_many(self, releases):
+        """Release (plan_id, plan_time, tender_id) slots; releases of one day
+        share a save. Failed releases are logged and skipped, their result
+        is False."""
+        releases = [
+            Release(plan_id, plan_time.time().isoformat(), tender_id)
+            for plan_id, plan_time, tender_id in releases
+        ]
+        for release in releases:
+            self.submit(release.plan_id, release)
+        results = []
+        for release in releases:
+            try:
+                results.append(release.result.get())
+            except Exception as e:
+                LOGGER.warning("Error on releasing slot of {} in plan {}: {}".format(release.tender_id, release.plan_id, repr(e)),
+                               extra={'MESSAGE_ID': 'error_release_slot'})
+                results.append(False)
+        return results
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from random import random
+from time import sleep, time
+
+
+class RetryBudgetExceeded(Exception):
+    """Raised when a call keeps failing after its retry budget is spent."""
+
+
+class Retry(object):
+    """Capped exponential backoff with jitter and a retry budget.
+
+    A call is attempted at most `attempts` times and never longer than
+    `budget` seconds. Delays grow as `base_delay * 2 ** n` up to `max_delay`
+    and are jittered over their upper half. `timeout` is the per-attempt
+    timeout callers pass to their requests.
+    """
+
+    options = (
+        ('attempts', int),
+        ('timeout', float),
+        ('base_delay', float),
+        ('max_delay', float),
+        ('budget', float),
+    )
+
+    def __init__(self, attempts=8, timeout=30, base_delay=1, max_delay=60, budget=600):
+        self.attempts = attempts
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def configure(self, settings, prefix='retry.'):
+        for name, cast in self.options:
+            if prefix + name in settings:
+                setattr(self, name, cast(settings[prefix + name]))
+
+    def delays(self):
+        for attempt in range(self.attempts - 1):
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+            yield delay / 2. + random() * delay / 2.
+
+    def __call__(self, func, done=None):
+        """Call func until it returns a result accepted by done.
+
+        Exceptions count as failed attempts. Raises RetryBudgetExceeded
+        with the last error or result when the budget is spent.
+        """
+        deadline = time() + self.budget
+        delays = self.delays()
+        while True:
+            try:
+                result = func()
+            except Exception as e:
+                last = e
+            else:
+                if done is None or done(result):
+                    return result
+                last = result
+            delay = next(delays, None)
+            if delay is None or time() + delay > deadline:
+                raise RetryBudgetExceeded(last)
+            sleep(delay)
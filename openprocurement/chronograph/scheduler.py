@@ -1,24 +1,33 @@
 # -*- coding: utf-8 -*-
-import grequests
 import requests
+from apscheduler.jobstores.base import JobLookupError
 from couchdb.http import ResourceConflict
 from datetime import datetime, timedelta, time
-from gevent.pool import Pool
-from iso8601 import parse_date
+from heapq import heapify, heappop, heappush
 from json import dumps
 from logging import getLogger
-from openprocurement.chronograph.utils import context_unpack
-from openprocurement.chronograph.design import plan_tenders_view
+from openprocurement.chronograph.utils import context_unpack, parse_date, set_logging_context
+from openprocurement.chronograph.design import plan_tender_ids_view
+from openprocurement.chronograph.jobstores import batch_jobs, lookup_jobs
+from openprocurement.chronograph.metrics import PLAN_CONFLICTS, PLANNING_DAYS, PLANNING_TIME, PUSH_ATTEMPTS, timed
+from openprocurement.chronograph.outbound import Outbound
+from openprocurement.chronograph.pipeline import run_pipeline
+from openprocurement.chronograph.retry import Retry, RetryBudgetExceeded
+from openprocurement.chronograph.smoothing import Smoother
+from openprocurement.chronograph.workdays import get_working_days as working_days
 from os import environ
 from pytz import timezone
 from random import randint
-from time import sleep
+from urllib import urlencode
+from urlparse import parse_qsl, urlsplit, urlunsplit
+from uuid import uuid4
 
 
 LOGGER = getLogger(__name__)
 TZ = timezone(environ['TZ'] if 'TZ' in environ else 'Europe/Kiev')
 CALENDAR_ID = 'calendar'
 STREAMS_ID = 'streams'
+SYNC_ID = 'sync'
 WORKING_DAY_START = time(11, 0)
 WORKING_DAY_END = time(16, 0)
 ROUNDING = timedelta(minutes=15)
@@ -29,11 +38,19 @@ STAND_STILL_TIME = timedelta(days=1)
 SMOOTHING_MIN = 10
 SMOOTHING_REMIN = 60
 SMOOTHING_MAX = 300  # value should be greater than SMOOTHING_MIN and SMOOTHING_REMIN
-ADAPTER = requests.adapters.HTTPAdapter(pool_connections=3, pool_maxsize=3)
-SESSION = requests.Session()
-SESSION.mount('http://', ADAPTER)
-SESSION.mount('https://', ADAPTER)
-POOL = Pool(1)
+COALESCE_WINDOW = timedelta(seconds=60)
+OUTBOUND = Outbound()
+SESSION = OUTBOUND.session
+RETRY = Retry()
+SMOOTHER = Smoother()
+DISPATCHER = None
+CALLBACK_URL = ''
+RESYNC, RECHECK = range(2)
+TENDER_PATHS = ('resync/', 'recheck/')
+OPT_FIELDS = ('status', 'auctionPeriod', 'lots', 'next_check')
+FEED_HEAD = 'tenders?mode=_all_&feed=changes&descending=1&opt_fields=' + '%2C'.join(OPT_FIELDS)
+SYNC_DOCS = {}
+CURSOR_REFRESH = timedelta(minutes=5)
 
 
 def get_now():
@@ -48,6 +65,11 @@ def get_calendar(db, calendar_id=CALENDAR_ID):
     return db.get(calendar_id, {'_id': calendar_id})
 
 
+def get_working_days(db, index=None):
+    calendar = index and index.get(CALENDAR_ID)
+    return working_days(calendar or get_calendar(db))
+
+
 def set_holiday(db, day):
     calendar = get_calendar(db)
     key = parse_date(day).date().isoformat()
@@ -63,8 +85,11 @@ def delete_holiday(db, day):
         db.save(calendar)
 
 
-def get_streams(db, streams_id=STREAMS_ID):
-    return db.get(streams_id, {'_id': streams_id, 'streams': 10}).get('streams')
+def get_streams(db, streams_id=STREAMS_ID, index=None):
+    streams_doc = index and index.get(streams_id)
+    if streams_doc is None:
+        streams_doc = db.get(streams_id, {'_id': streams_id})
+    return streams_doc.get('streams', 10)
 
 
 def set_streams(db, streams, streams_id=STREAMS_ID):
@@ -73,24 +98,139 @@ def set_streams(db, streams, streams_id=STREAMS_ID):
     db.save(streams_doc)
 
 
-def get_date(db, mode, date):
-    plan_id = 'plan{}_{}'.format(mode, date.isoformat())
-    plan = db.get(plan_id, {'_id': plan_id})
+def get_sync(db, sync_id=SYNC_ID):
+    return db.get(sync_id, {'_id': sync_id})
+
+
+def save_cursor(db, sync_id, name, url, tenders):
+    """Save feed cursor name after a page, skipping idle repeats."""
+    cached_db, doc = SYNC_DOCS.pop(sync_id, (None, None))
+    if cached_db is not db:
+        doc = get_sync(db, sync_id)
+    cursor = doc.get(name, {})
+    if not tenders and cursor.get('stopped') and cursor.get('url') == url and \
+            get_now() - parse_date(cursor['updated'], TZ) < CURSOR_REFRESH:
+        SYNC_DOCS[sync_id] = (db, doc)
+        return doc
+    while True:
+        cursor = doc.setdefault(name, {})
+        cursor['url'] = url
+        cursor['updated'] = get_now().isoformat()
+        cursor['pages'] = cursor.get('pages', 0) + 1
+        cursor['tenders'] = cursor.get('tenders', 0) + len(tenders)
+        cursor['stopped'] = not tenders
+        if tenders and tenders[-1].get('dateModified'):
+            cursor['date_modified'] = tenders[-1]['dateModified']
+        try:
+            db.save(doc)
+        except ResourceConflict:
+            doc = get_sync(db, sync_id)
+            continue
+        SYNC_DOCS[sync_id] = (db, doc)
+        return doc
+
+
+def sync_progress(db, scheduler, sync_id=SYNC_ID):
+    """Return the feed cursors with their lag and next sync runs."""
+    doc = get_sync(db, sync_id)
+    now = get_now()
+    progress = {}
+    for name, job_id in (('forward', 'resync_all'), ('backward', 'resync_back')):
+        cursor = dict(doc.get(name, {}))
+        job = scheduler.get_job(job_id)
+        cursor['next_run_time'] = job and job.next_run_time and job.next_run_time.isoformat()
+        if cursor.get('stopped'):
+            cursor['lag'] = (now - parse_date(cursor['updated'], TZ)).total_seconds()
+        elif cursor.get('date_modified'):
+            cursor['lag'] = (now - parse_date(cursor['date_modified'], TZ)).total_seconds()
+        progress[name] = cursor
+    return progress
+
+
+def get_plan_id(mode, date):
+    return 'plan{}_{}'.format(mode, date.isoformat())
+
+
+def get_plan(db, plan_id, index=None, plans=None):
+    plan = plans.get(plan_id) if plans else None
+    if plan is None:
+        plan = index and index.get(plan_id)
+    if plan is None:
+        plan = db.get(plan_id, {'_id': plan_id})
+    if plans is not None:
+        plans[plan_id] = plan
+    return plan
+
+
+def get_plans(db, plan_ids, index=None):
+    """Return plan id -> plan, loading the missing ones in one request."""
+    plans = {}
+    for plan_id in plan_ids:
+        plan = index and index.get(plan_id)
+        if plan is not None:
+            plans[plan_id] = plan
+    missing = [plan_id for plan_id in plan_ids if plan_id not in plans]
+    if missing:
+        for row in db.view('_all_docs', keys=missing, include_docs=True):
+            plans[row.key] = row.doc or {'_id': row.key}
+    return plans
+
+
+def get_plan_time(plan, date):
     plan_date_end = plan.get('time', WORKING_DAY_START.isoformat())
     plan_date = parse_date(date.isoformat() + 'T' + plan_date_end, None)
     plan_date = plan_date.astimezone(TZ) if plan_date.tzinfo else TZ.localize(plan_date)
-    return plan_date.time(), plan.get('streams', 1), plan
+    return plan_date.time(), plan.get('streams', 1)
+
+
+def save_plan(db, plan, index=None):
+    try:
+        db.save(plan)
+    except ResourceConflict:
+        PLAN_CONFLICTS.inc()
+        if index:
+            index.invalidate(plan['_id'])
+        raise
+    if index:
+        index.update(plan)
+
+
+def save_plans(db, plans, index=None):
+    """Save plans with one bulk request and return ids of conflicted ones."""
+    conflicts = set()
+    for plan, (success, plan_id, _) in zip(plans, db.update(plans)):
+        if success:
+            if index:
+                index.update(plan)
+        else:
+            conflicts.add(plan_id)
+            PLAN_CONFLICTS.inc()
+            if index:
+                index.invalidate(plan_id)
+    return conflicts
 
 
-def set_date(db, plan, end_time, cur_stream, tender_id, start_time, new_slot=True):
+def book_slot(plan, end_time, cur_stream, tender_id, start_time, new_slot=True):
     if new_slot:
         plan['time'] = end_time.isoformat()
         plan['streams'] = cur_stream
+    else:
+        free = get_free_slots(plan)
+        slot = [start_time.isoformat(), cur_stream]
+        if free and free[0] == slot:
+            heappop(free)
+        elif slot in free:
+            free.remove(slot)
+            heapify(free)
     stream_id = 'stream_{}'.format(cur_stream)
     stream = plan.get(stream_id, {})
     stream[start_time.isoformat()] = tender_id
     plan[stream_id] = stream
-    db.save(plan)
+
+
+def set_date(db, plan, end_time, cur_stream, tender_id, start_time, new_slot=True, index=None):
+    book_slot(plan, end_time, cur_stream, tender_id, start_time, new_slot)
+    save_plan(db, plan, index)
 
 
 def calc_auction_end_time(bids, start):
@@ -101,66 +241,118 @@ def calc_auction_end_time(bids, start):
     return (end + timedelta(0, rounding - seconds, -end.microsecond)).astimezone(TZ)
 
 
+def get_free_slots(plan):
+    """Return the heap of freed [time, stream] slots of the plan."""
+    if 'free' not in plan:
+        free = []
+        for cur_stream in range(1, plan.get('streams', 0) + 1):
+            stream = plan.get('stream_{}'.format(cur_stream), {})
+            free.extend([[slot, cur_stream] for slot in stream if stream[slot] is None])
+        heapify(free)
+        plan['free'] = free
+    return plan['free']
+
+
 def find_free_slot(plan):
-    streams = plan.get('streams', 0)
-    for cur_stream in range(1, streams + 1):
-        stream_id = 'stream_{}'.format(cur_stream)
-        for slot in plan[stream_id]:
-            if plan[stream_id].get(slot) is None:
-                plan_date = parse_date(plan['_id'].split('_')[1] + 'T' + slot, None)
-                plan_date = plan_date.astimezone(TZ) if plan_date.tzinfo else TZ.localize(plan_date)
-                return plan_date, cur_stream
+    free = get_free_slots(plan)
+    while free:
+        slot, cur_stream = free[0]
+        if plan.get('stream_{}'.format(cur_stream), {}).get(slot, '') is None:
+            plan_date = parse_date(plan['_id'].split('_')[1] + 'T' + slot, None)
+            plan_date = plan_date.astimezone(TZ) if plan_date.tzinfo else TZ.localize(plan_date)
+            return plan_date, cur_stream
+        heappop(free)
 
 
-def planning_auction(tender, start, db, quick=False, lot_id=None):
+def get_first_date(start):
+    start += timedelta(hours=1)
+    if start.time() < WORKING_DAY_START:
+        return start.date()
+    return start.date() + timedelta(days=1)
+
+
+def find_day_slot(plan, date, streams):
+    """Return the first free slot of the plan day or None."""
+    dayStart, stream = get_plan_time(plan, date)
+    freeSlot = find_free_slot(plan)
+    if freeSlot:
+        startDate, stream = freeSlot
+        return startDate, startDate, startDate.time(), stream, False
+    if dayStart >= WORKING_DAY_END and stream >= streams:
+        return None
+    if dayStart >= WORKING_DAY_END and stream < streams:
+        stream += 1
+        dayStart = WORKING_DAY_START
+    start = TZ.localize(datetime.combine(date, dayStart))
+    # end = calc_auction_end_time(tender.get('numberOfBids', len(tender.get('bids', []))), start)
+    end = start + timedelta(minutes=30)
+    if dayStart == WORKING_DAY_START and end > TZ.localize(datetime.combine(date, WORKING_DAY_END)):
+        return start, end, dayStart, stream, True
+    elif end <= TZ.localize(datetime.combine(date, WORKING_DAY_END)):
+        return start, end, dayStart, stream, True
+
+
+def find_slot(db, mode, start, calendar, streams, index=None, plans=None):
+    """Return the first free slot on working days from start."""
+    skipped_days = 0
+    nextDate = calendar.next(get_first_date(start))
+    while True:
+        plan_id = get_plan_id(mode, nextDate)
+        if not index or not index.is_full(plan_id, streams):
+            plan = get_plan(db, plan_id, index, plans)
+            slot = find_day_slot(plan, nextDate, streams)
+            if slot:
+                break
+            if index and plans is None:
+                index.mark_full(plan, streams)
+        nextDate = calendar.add(nextDate, 1)
+        skipped_days += 1
+    start, end, dayStart, stream, new_slot = slot
+    return start, end, dayStart, stream, plan, new_slot, skipped_days
+
+
+def planning_auction(tender, start, db, quick=False, lot_id=None, index=None):
     tid = tender.get('id', '')
     mode = tender.get('mode', '')
-    calendar = get_calendar(db)
-    streams = get_streams(db)
+    calendar = get_working_days(db, index)
+    streams = get_streams(db, index=index)
     skipped_days = 0
     if quick:
         quick_start = calc_auction_end_time(0, start)
         return (quick_start, 0, skipped_days)
-    start += timedelta(hours=1)
-    if start.time() < WORKING_DAY_START:
-        nextDate = start.date()
-    else:
-        nextDate = start.date() + timedelta(days=1)
-    new_slot = True
-    while True:
-        if calendar.get(nextDate.isoformat()) or nextDate.weekday() in [5, 6]:  # skip Saturday and Sunday
-            nextDate += timedelta(days=1)
-            continue
-        dayStart, stream, plan = get_date(db, mode, nextDate)
-        freeSlot = find_free_slot(plan)
-        if freeSlot:
-            startDate, stream = freeSlot
-            start, end, dayStart, new_slot = startDate, startDate, startDate.time(), False
-            break
-        if dayStart >= WORKING_DAY_END and stream >= streams:
-            nextDate += timedelta(days=1)
-            skipped_days += 1
-            continue
-        if dayStart >= WORKING_DAY_END and stream < streams:
-            stream += 1
-            dayStart = WORKING_DAY_START
-        start = TZ.localize(datetime.combine(nextDate, dayStart))
-        # end = calc_auction_end_time(tender.get('numberOfBids', len(tender.get('bids', []))), start)
-        end = start + timedelta(minutes=30)
-        if dayStart == WORKING_DAY_START and end > TZ.localize(datetime.combine(nextDate, WORKING_DAY_END)):
-            break
-        elif end <= TZ.localize(datetime.combine(nextDate, WORKING_DAY_END)):
-            break
-        nextDate += timedelta(days=1)
-        skipped_days += 1
-    #for n in range((end.date() - start.date()).days):
-        #date = start.date() + timedelta(n)
-        #_, dayStream = get_date(db, mode, date.date())
-        #set_date(db, mode, date.date(), WORKING_DAY_END, dayStream+1)
-    set_date(db, plan, end.time(), stream, "_".join([tid, lot_id]) if lot_id else tid, dayStart, new_slot)
+    start, end, dayStart, stream, plan, new_slot, skipped_days = find_slot(db, mode, start, calendar, streams, index)
+    set_date(db, plan, end.time(), stream, "_".join([tid, lot_id]) if lot_id else tid, dayStart, new_slot, index)
     return (start, stream, skipped_days)
 
 
+def planning_lots(tender, lots, db, quick=False, index=None):
+    """Plan all lots of a tender, saving each day once."""
+    tid = tender.get('id', '')
+    mode = tender.get('mode', '')
+    if quick:
+        return dict([(lot_id, (calc_auction_end_time(0, start), 0, 0)) for lot_id, start in lots])
+    calendar = get_working_days(db, index)
+    streams = get_streams(db, index=index)
+    results = {}
+    pending = list(lots)
+    while pending:
+        plans = {}
+        booked = {}
+        for lot_id, start in pending:
+            slot_start, end, dayStart, stream, plan, new_slot, skip_days = find_slot(db, mode, start, calendar, streams, index, plans)
+            book_slot(plan, end.time(), stream, "_".join([tid, lot_id]), dayStart, new_slot)
+            booked.setdefault(plan['_id'], []).append((lot_id, start, (slot_start, stream, skip_days)))
+        conflicts = save_plans(db, [plans[plan_id] for plan_id in booked], index)
+        pending = []
+        for plan_id, plan_lots in booked.items():
+            for lot_id, start, result in plan_lots:
+                if plan_id in conflicts:
+                    pending.append((lot_id, start))
+                else:
+                    results[lot_id] = result
+    return results
+
+
 def skipped_days(days):
     days_str = ''
     if days:
@@ -170,17 +362,14 @@ def skipped_days(days):
 
 def check_tender(request, tender, db):
     now = get_now()
+    planner = request.registry.planner
     quick = environ.get('SANDBOX_MODE', False) and u'quick' in tender.get('submissionMethodDetails', '')
     if not tender.get('lots') and 'shouldStartAfter' in tender.get('auctionPeriod', {}) and tender['auctionPeriod']['shouldStartAfter'] > tender['auctionPeriod'].get('startDate'):
         period = tender.get('auctionPeriod')
-        shouldStartAfter = max(parse_date(period.get('shouldStartAfter'), TZ).astimezone(TZ), now)
-        planned = False
-        while not planned:
-            try:
-                auctionPeriod, stream, skip_days = planning_auction(tender, shouldStartAfter, db, quick)
-                planned = True
-            except ResourceConflict:
-                planned = False
+        shouldStartAfter = max(parse_date(period.get('shouldStartAfter'), TZ, TZ), now)
+        with timed(PLANNING_TIME):
+            auctionPeriod, stream, skip_days = planner.plan(tender, shouldStartAfter, quick)
+        PLANNING_DAYS.observe(skip_days)
         auctionPeriod = randomize(auctionPeriod).isoformat()
         planned = 'replanned' if period.get('startDate') else 'planned'
         LOGGER.info('{} auction for tender {} to {}. Stream {}.{}'.format(planned.title(), tender['id'], auctionPeriod, stream, skipped_days(skip_days)),
@@ -189,21 +378,23 @@ def check_tender(request, tender, db):
                                          {'PLANNED_DATE': auctionPeriod, 'PLANNED_STREAM': stream, 'PLANNED_DAYS_SKIPPED': skip_days}))
         return {'auctionPeriod': {'startDate': auctionPeriod}}
     elif tender.get('lots'):
-        lots = []
+        periods = []
         for lot in tender.get('lots', []):
             if lot['status'] != 'active' or 'shouldStartAfter' not in lot.get('auctionPeriod', {}) or lot['auctionPeriod']['shouldStartAfter'] < lot['auctionPeriod'].get('startDate'):
-                lots.append({})
                 continue
             period = lot.get('auctionPeriod')
-            shouldStartAfter = max(parse_date(period.get('shouldStartAfter'), TZ).astimezone(TZ), now)
+            periods.append((lot['id'], max(parse_date(period.get('shouldStartAfter'), TZ, TZ), now)))
+        with timed(PLANNING_TIME):
+            planned_lots = planner.plan_lots(tender, periods, quick) if periods else {}
+        lots = []
+        for lot in tender.get('lots', []):
             lot_id = lot['id']
-            planned = False
-            while not planned:
-                try:
-                    auctionPeriod, stream, skip_days = planning_auction(tender, shouldStartAfter, db, quick, lot_id)
-                    planned = True
-                except ResourceConflict:
-                    planned = False
+            if lot_id not in planned_lots:
+                lots.append({})
+                continue
+            period = lot.get('auctionPeriod')
+            auctionPeriod, stream, skip_days = planned_lots[lot_id]
+            PLANNING_DAYS.observe(skip_days)
             auctionPeriod = randomize(auctionPeriod).isoformat()
             planned = 'replanned' if period.get('startDate') else 'planned'
             lots.append({'auctionPeriod': {'startDate': auctionPeriod}})
@@ -217,131 +408,313 @@ def check_tender(request, tender, db):
 
 
 def get_request(url, auth, headers=None):
-    tx = ty = 1
-    while True:
-        try:
-            request = grequests.get(url, auth=auth, headers=headers, session=SESSION)
-            grequests.send(request, POOL).join()
-            r = request.response
-        except:
-            pass
-        else:
-            break
-        sleep(tx)
-        tx, ty = ty, tx + ty
-    return r
+    def send():
+        return OUTBOUND.get(url, auth=auth, headers=headers, timeout=RETRY.timeout)
+    return RETRY(send)
+
+
+class JobRequest(object):
+    """Lightweight stand-in for a pyramid request of a job run in process."""
+
+    def __init__(self, registry, path, params=None, matchdict=None):
+        self.registry = registry
+        self.path_info = '/' + path
+        self.url = registry.callback_url + path
+        self.params = params or {}
+        self.matchdict = matchdict or {}
+        self.environ = {'REQUEST_ID': 'req-{}'.format(uuid4())}
+        self.headers = {}
+        self.remote_addr = ''
+        self.user_agent = 'chronograph'
+        set_logging_context(self)
+
+
+class Dispatcher(object):
+    """Runs callbacks under `callback.url` in process."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.routes = {
+            'resync_all': resync_tenders,
+            'resync_back': resync_tenders_back,
+        }
+        self.tender_routes = {
+            'resync': resync_tender,
+            'recheck': recheck_tender,
+        }
+
+    def match(self, url):
+        callback_url = self.registry.callback_url
+        if not callback_url or not url.startswith(callback_url):
+            return None
+        path = url[len(callback_url):]
+        if path in self.routes:
+            return path, self.routes[path], {}
+        name, _, tender_id = path.partition('/')
+        if name in self.tender_routes and tender_id and '/' not in tender_id:
+            return path, self.tender_routes[name], {'tender_id': tender_id}
+
+    def __call__(self, url, params):
+        """Run the job of url and return True, or False if url is not local."""
+        route = self.match(url)
+        if route is None:
+            return False
+        path, view, matchdict = route
+        view(JobRequest(self.registry, path, params, matchdict))
+        return True
+
+
+def set_dispatcher(registry):
+    global DISPATCHER
+    DISPATCHER = Dispatcher(registry) if registry else None
+
+
+def set_callback_url(url):
+    global CALLBACK_URL
+    CALLBACK_URL = url or ''
+
+
+class PushFailed(RetryBudgetExceeded):
+    """Push of url failed; the job runs `func` with `job_args` again."""
+
+    def __init__(self, url, params, func=None, job_args=None):
+        super(PushFailed, self).__init__(url, params)
+        self.url = url
+        self.params = params
+        self.func = func or push
+        self.job_args = job_args or [url, params]
 
 
 def push(url, params):
-    tx = ty = 1
-    while True:
+    """Run a job callback: once in process if local, else retried GETs."""
+    if DISPATCHER and DISPATCHER.match(url):
         try:
-            r = requests.get(url, params=params)
-        except:
-            pass
-        else:
-            if r.status_code == requests.codes.ok:
-                break
-        sleep(tx)
-        tx, ty = ty, tx + ty
+            DISPATCHER(url, params)
+        except Exception as e:
+            PUSH_ATTEMPTS.inc(result='error')
+            LOGGER.error("Error on dispatching '{}': {}".format(url, repr(e)),
+                         extra={'MESSAGE_ID': 'error_dispatch'})
+            raise PushFailed(url, params)
+        PUSH_ATTEMPTS.inc(result='ok')
+        return
+
+    def send():
+        try:
+            ok = SESSION.get(url, params=params, timeout=RETRY.timeout).status_code == requests.codes.ok
+        except Exception:
+            PUSH_ATTEMPTS.inc(result='error')
+            raise
+        PUSH_ATTEMPTS.inc(result='ok' if ok else 'failed')
+        return ok
+    try:
+        RETRY(send, bool)
+    except RetryBudgetExceeded:
+        raise PushFailed(url, params)
+
+
+def push_tender(kind, tender_id, recheck=0):
+    """Push the `RESYNC` or `RECHECK` callback of a tender."""
+    url = CALLBACK_URL + TENDER_PATHS[kind] + tender_id
+    params = {'recheck': 1} if recheck else None
+    try:
+        push(url, params)
+    except PushFailed:
+        args = (kind, tender_id, recheck) if recheck else (kind, tender_id)
+        raise PushFailed(url, params, push_tender, args)
+
+
+def requeue_job(scheduler, event):
+    """Put back a job whose push ran out of its retry budget."""
+    exception = getattr(event, 'exception', None)
+    if not isinstance(exception, PushFailed) or scheduler.get_job(event.job_id):
+        return
+    LOGGER.warning("Requeue job {} after failed push to '{}'".format(event.job_id, exception.url),
+                   extra={'MESSAGE_ID': 'requeue_job'})
+    run_date = SMOOTHER.pick(get_now(), SMOOTHING_REMIN, SMOOTHING_MAX)
+    SMOOTHER.add(run_date)
+    scheduler.add_job(exception.func, 'date', run_date=run_date,
+                      id=event.job_id, args=exception.job_args, replace_existing=True)
+
+
+def set_coalesce_window(seconds):
+    global COALESCE_WINDOW
+    COALESCE_WINDOW = timedelta(seconds=seconds)
+
+
+def rechecks(job):
+    """Whether job is a resync job that also rechecks the tender."""
+    if job is None:
+        return False
+    if job.func is push_tender:
+        return len(job.args) > 2 and bool(job.args[2])
+    return bool(job.args[1] and job.args[1].get('recheck'))
+
+
+def due_within(job, start):
+    """Whether job already runs within the smoothing jitter after start."""
+    if job is None or job.next_run_time is None:
+        return False
+    end = start + timedelta(seconds=SMOOTHING_MAX)
+    if rechecks(job):
+        end += COALESCE_WINDOW
+    return start <= job.next_run_time <= end
+
+
+def add_resync_job(scheduler, tender_id, run_date, recheck=False):
+    SMOOTHER.add(run_date)
+    scheduler.add_job(push_tender, 'date', run_date=run_date, id=tender_id, replace_existing=True,
+                      args=(RESYNC, tender_id, 1) if recheck else (RESYNC, tender_id))
+
+
+def add_recheck_job(scheduler, tender_id, run_date):
+    SMOOTHER.add(run_date)
+    scheduler.add_job(push_tender, 'date', run_date=run_date, id="recheck_{}".format(tender_id),
+                      replace_existing=True, args=(RECHECK, tender_id))
+
+
+def schedule_jobs(scheduler, tender_id, resync_date=None, recheck_date=None, resync_job=None, recheck_job=None, recheck=False):
+    """Move tender jobs to the dates given, merging ones close together."""
+    if not resync_date and not recheck_date:
+        return
+    if recheck_job is None and rechecks(resync_job):
+        # the recheck moves together with the resync job carrying it
+        resync_date = resync_date or resync_job.next_run_time
+        recheck_date = recheck_date or resync_job.next_run_time
+    resync_at = resync_date or (resync_job and resync_job.next_run_time)
+    recheck_at = recheck_date or (recheck_job and recheck_job.next_run_time)
+    if COALESCE_WINDOW and resync_at and recheck_at and abs(resync_at - recheck_at) <= COALESCE_WINDOW:
+        if resync_job:
+            SMOOTHER.discard(resync_job.next_run_time)
+        add_resync_job(scheduler, tender_id, max(resync_at, recheck_at), True)
+        if recheck_job:
+            SMOOTHER.discard(recheck_job.next_run_time)
+            try:
+                scheduler.remove_job(recheck_job.id)
+            except JobLookupError:
+                pass
+        return
+    if resync_date:
+        if resync_job:
+            SMOOTHER.discard(resync_job.next_run_time)
+        add_resync_job(scheduler, tender_id, resync_date, recheck)
+    if recheck_date:
+        if recheck_job:
+            SMOOTHER.discard(recheck_job.next_run_time)
+        add_recheck_job(scheduler, tender_id, recheck_date)
+
+
+def next_recheck_date(job, next_check, now):
+    """Return the recheck run date for next_check, None if job is due then."""
+    start = max(next_check, now)
+    if not due_within(job, start):
+        return SMOOTHER.pick(start, SMOOTHING_MIN, SMOOTHING_MAX)
+
+
+def patch_check(request, tender_id):
+    """PATCH the tender to run its checks and return the next check date."""
+    url = request.registry.api_url + 'tenders/' + tender_id
+    request_id = request.environ.get('REQUEST_ID', '')
+    r = OUTBOUND.patch(url,
+                      data=dumps({'data': {'id': tender_id}}),
+                      headers={'Content-Type': 'application/json', 'X-Client-Request-ID': request_id},
+                      auth=(request.registry.api_token, ''))
+    if r.status_code != requests.codes.ok:
+        LOGGER.error("Error {} on checking tender '{}': {}".format(r.status_code, url, r.text),
+                     extra=context_unpack(request, {'MESSAGE_ID': 'error_check_tender'}, {'ERROR_STATUS': r.status_code}))
+        if r.status_code not in [requests.codes.forbidden, requests.codes.not_found, requests.codes.gone]:
+            return get_now() + timedelta(minutes=1)
+    elif r.json() and r.json()['data'].get('next_check'):
+        return parse_date(r.json()['data']['next_check'], TZ, TZ)
 
 
 def resync_tender(request):
     tender_id = request.matchdict['tender_id']
+    cluster = request.registry.cluster
+    if cluster and not cluster.owns(tender_id):
+        return
     scheduler = request.registry.scheduler
     url = request.registry.api_url + 'tenders/' + tender_id
     api_token = request.registry.api_token
-    resync_url = request.registry.callback_url + 'resync/' + tender_id
-    recheck_url = request.registry.callback_url + 'recheck/' + tender_id
+    recheck = bool(request.params.get('recheck'))
     db = request.registry.db
     request_id = request.environ.get('REQUEST_ID', '')
     next_check = None
     next_sync = None
-    r = get_request(url, auth=(api_token, ''), headers={'X-Client-Request-ID': request_id})
-    if r.status_code != requests.codes.ok:
-        LOGGER.error("Error {} on getting tender '{}': {}".format(r.status_code, url, r.text),
-                     extra=context_unpack(request, {'MESSAGE_ID': 'error_get_tender'}, {'ERROR_STATUS': r.status_code}))
-        if r.status_code in [requests.codes.not_found, requests.codes.gone]:
-            return
-        changes = None
+    try:
+        r = get_request(url, auth=(api_token, ''), headers={'X-Client-Request-ID': request_id})
+    except RetryBudgetExceeded as e:
+        LOGGER.error("Error on getting tender '{}': {}".format(url, repr(e)),
+                     extra=context_unpack(request, {'MESSAGE_ID': 'error_get_tender'}))
         next_sync = get_now() + timedelta(seconds=randint(SMOOTHING_REMIN, SMOOTHING_MAX))
     else:
-        json = r.json()
-        tender = json['data']
-        changes = check_tender(request, tender, db)
-        if changes:
-            data = dumps({'data': changes})
-            r = SESSION.patch(url,
-                              data=data,
-                              headers={'Content-Type': 'application/json', 'X-Client-Request-ID': request_id},
-                              auth=(api_token, ''))
-            if r.status_code != requests.codes.ok:
-                LOGGER.error("Error {} on updating tender '{}' with '{}': {}".format(r.status_code, url, data, r.text),
-                             extra=context_unpack(request, {'MESSAGE_ID': 'error_patch_tender'}, {'ERROR_STATUS': r.status_code}))
-                next_sync = get_now() + timedelta(seconds=randint(SMOOTHING_REMIN, SMOOTHING_MAX))
-            elif r.json():
-                if r.json()['data'].get('next_check'):
-                    next_check = parse_date(r.json()['data']['next_check'], TZ).astimezone(TZ)
-    if next_check:
-        check_args = dict(timezone=TZ, id="recheck_{}".format(tender_id),
-                          name="Recheck {}".format(tender_id),
-                          misfire_grace_time=60 * 60, replace_existing=True,
-                          args=[recheck_url, None])
-        if next_check < get_now():
-            scheduler.add_job(push, 'date', run_date=get_now()+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), **check_args)
+        if r.status_code != requests.codes.ok:
+            LOGGER.error("Error {} on getting tender '{}': {}".format(r.status_code, url, r.text),
+                         extra=context_unpack(request, {'MESSAGE_ID': 'error_get_tender'}, {'ERROR_STATUS': r.status_code}))
+            if r.status_code in [requests.codes.not_found, requests.codes.gone]:
+                return
+            changes = None
+            next_sync = get_now() + timedelta(seconds=randint(SMOOTHING_REMIN, SMOOTHING_MAX))
         else:
-            scheduler.add_job(push, 'date', run_date=next_check+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), **check_args)
-    if next_sync:
-        scheduler.add_job(push, 'date', run_date=next_sync+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), timezone=TZ,
-                          id=tender_id, name="Resync {}".format(tender_id),
-                          misfire_grace_time=60 * 60, replace_existing=True,
-                          args=[resync_url, None])
+            json = r.json()
+            tender = json['data']
+            changes = check_tender(request, tender, db)
+            if changes:
+                data = dumps({'data': changes})
+                r = OUTBOUND.patch(url,
+                                  data=data,
+                                  headers={'Content-Type': 'application/json', 'X-Client-Request-ID': request_id},
+                                  auth=(api_token, ''))
+                if r.status_code != requests.codes.ok:
+                    LOGGER.error("Error {} on updating tender '{}' with '{}': {}".format(r.status_code, url, data, r.text),
+                                 extra=context_unpack(request, {'MESSAGE_ID': 'error_patch_tender'}, {'ERROR_STATUS': r.status_code}))
+                    next_sync = get_now() + timedelta(seconds=randint(SMOOTHING_REMIN, SMOOTHING_MAX))
+                elif r.json():
+                    if r.json()['data'].get('next_check'):
+                        next_check = parse_date(r.json()['data']['next_check'], TZ, TZ)
+            elif recheck:
+                next_check = patch_check(request, tender_id)
+            recheck = recheck and next_sync is not None
+    recheck_job = None
+    recheck_date = None
+    if next_check:
+        recheck_job = scheduler.get_job("recheck_{}".format(tender_id))
+        recheck_date = next_recheck_date(recheck_job, next_check, get_now())
+    resync_date = next_sync and SMOOTHER.pick(next_sync, SMOOTHING_MIN, SMOOTHING_MAX)
+    schedule_jobs(scheduler, tender_id, resync_date, recheck_date, None, recheck_job, recheck)
     return next_sync and next_sync.isoformat()
 
 
 def recheck_tender(request):
     tender_id = request.matchdict['tender_id']
+    cluster = request.registry.cluster
+    if cluster and not cluster.owns(tender_id):
+        return
     scheduler = request.registry.scheduler
-    url = request.registry.api_url + 'tenders/' + tender_id
-    api_token = request.registry.api_token
-    recheck_url = request.registry.callback_url + 'recheck/' + tender_id
-    request_id = request.environ.get('REQUEST_ID', '')
-    next_check = None
-    r = SESSION.patch(url,
-                      data=dumps({'data': {'id': tender_id}}),
-                      headers={'Content-Type': 'application/json', 'X-Client-Request-ID': request_id},
-                      auth=(api_token, ''))
-    if r.status_code != requests.codes.ok:
-        LOGGER.error("Error {} on checking tender '{}': {}".format(r.status_code, url, r.text),
-                     extra=context_unpack(request, {'MESSAGE_ID': 'error_check_tender'}, {'ERROR_STATUS': r.status_code}))
-        if r.status_code not in [requests.codes.forbidden, requests.codes.not_found, requests.codes.gone]:
-            next_check = get_now() + timedelta(minutes=1)
-    elif r.json() and r.json()['data'].get('next_check'):
-        next_check = parse_date(r.json()['data']['next_check'], TZ).astimezone(TZ)
+    next_check = patch_check(request, tender_id)
     if next_check:
-        check_args = dict(timezone=TZ, id="recheck_{}".format(tender_id),
-                          name="Recheck {}".format(tender_id),
-                          misfire_grace_time=60 * 60, replace_existing=True,
-                          args=[recheck_url, None])
-        if next_check < get_now():
-            scheduler.add_job(push, 'date', run_date=get_now()+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), **check_args)
-        else:
-            scheduler.add_job(push, 'date', run_date=next_check+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), **check_args)
+        recheck_date = next_recheck_date(None, next_check, get_now())
+        schedule_jobs(scheduler, tender_id, None, recheck_date, scheduler.get_job(tender_id))
     return next_check and next_check.isoformat()
 
 
-def free_slot(db, plan_id, plan_time, tender_id):
+def release_slot(plan, slot, tender_id):
+    streams = plan['streams']
+    free = get_free_slots(plan)
+    for cur_stream in range(1, streams + 1):
+        stream_id = 'stream_{}'.format(cur_stream)
+        if plan.get(stream_id, {}).get(slot) == tender_id:
+            plan[stream_id][slot] = None
+            heappush(free, [slot, cur_stream])
+
+
+def free_slot(db, plan_id, plan_time, tender_id, index=None):
     slot = plan_time.time().isoformat()
     done = False
     while not done:
         try:
             plan = db.get(plan_id)
-            streams = plan['streams']
-            for cur_stream in range(1, streams + 1):
-                stream_id = 'stream_{}'.format(cur_stream)
-                if plan[stream_id].get(slot) == tender_id:
-                    plan[stream_id][slot] = None
-            db.save(plan)
+            release_slot(plan, slot, tender_id)
+            save_plan(db, plan, index)
             done = True
         except ResourceConflict:
             done = False
@@ -349,90 +722,235 @@ def free_slot(db, plan_id, plan_time, tender_id):
             done = True
 
 
-def check_auction(db, tender):
+def find_orphan_slots(tender, slots):
+    """Return the booked slots of tender not matching its auctions."""
     auction_time = tender.get('auctionPeriod', {}).get('startDate') and parse_date(tender.get('auctionPeriod', {}).get('startDate'))
     lots = dict([
         (i['id'], parse_date(i.get('auctionPeriod', {}).get('startDate')))
         for i in tender.get('lots', [])
         if i.get('auctionPeriod', {}).get('startDate')
     ])
-    auc_dict = [
-        (x.key[1], TZ.localize(parse_date(x.value, None)), x.id)
-        for x in plan_tenders_view(db, startkey=[tender['id'], None], endkey=[tender['id'], 32 * "f"])
-    ]
-    for key, plan_time, plan_doc in auc_dict:
+    orphans = []
+    for key, plan_time, plan_doc in slots:
         if not key and (not auction_time or not plan_time < auction_time < plan_time + timedelta(minutes=30)):
-            free_slot(db, plan_doc, plan_time, tender['id'])
+            slot_tender_id = tender['id']
         elif key and (not lots.get(key) or lots.get(key) and not plan_time < lots.get(key) < plan_time + timedelta(minutes=30)):
-            free_slot(db, plan_doc, plan_time, "_".join([tender['id'], key]))
+            slot_tender_id = "_".join([tender['id'], key])
+        else:
+            continue
+        orphans.append((plan_doc, plan_time, slot_tender_id))
+    return orphans
+
+
+def release_slots(db, releases, planner=None):
+    if planner:
+        planner.release_many(releases)
+    elif releases:
+        free_slots(db, releases)
+
+
+def free_slots(db, releases, index=None):
+    """Release (plan_id, plan_time, tender_id) slots grouped by plan."""
+    pending = {}
+    for plan_id, plan_time, tender_id in releases:
+        pending.setdefault(plan_id, []).append((plan_time.time().isoformat(), tender_id))
+    while pending:
+        plans = []
+        for plan in get_plans(db, list(pending), index).values():
+            if not plan.get('streams'):
+                continue
+            try:
+                for slot, tender_id in pending[plan['_id']]:
+                    release_slot(plan, slot, tender_id)
+            except Exception as e:
+                LOGGER.warning("Error on releasing slots in plan {}: {}".format(plan['_id'], repr(e)),
+                               extra={'MESSAGE_ID': 'error_release_slot'})
+                continue
+            plans.append(plan)
+        conflicts = save_plans(db, plans, index) if plans else set()
+        pending = dict([(plan_id, pending[plan_id]) for plan_id in conflicts])
 
 
-def process_listing(tenders, scheduler, callback_url, db, check=True):
-    run_date = get_now()
+def check_auction(db, tender, planner=None):
+    check_auctions(db, [tender], planner)
+
+
+def check_auctions(db, tenders, planner=None):
+    """Release slots of tenders that no longer match their auctions."""
+    if not tenders:
+        return
+    slots = {}
+    for x in plan_tender_ids_view(db, keys=[tender['id'] for tender in tenders]):
+        slots.setdefault(x.key, []).append((x.value[0], TZ.localize(parse_date(x.value[1], None)), x.id))
+    releases = []
+    for tender in tenders:
+        releases.extend(find_orphan_slots(tender, slots.get(tender['id'], [])))
+    release_slots(db, releases, planner)
+
+
+def parse_listing(tenders):
+    """Return (tender, next_check, should_plan) for each tender of a page."""
+    parsed = []
     for tender in tenders:
-        if check:
-            check_auction(db, tender)
-        tid = tender['id']
         next_check = tender.get('next_check')
-        if next_check:
-            check_args = dict(timezone=TZ, id="recheck_{}".format(tid),
-                              name="Recheck {}".format(tid),
-                              misfire_grace_time=60 * 60, replace_existing=True,
-                              args=[callback_url + 'recheck/' + tid, None])
-            next_check = parse_date(next_check, TZ).astimezone(TZ)
-            recheck_job = scheduler.get_job("recheck_{}".format(tid))
-            if next_check < run_date:
-                scheduler.add_job(push, 'date', run_date=run_date+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), **check_args)
-            elif not recheck_job or recheck_job.next_run_time != next_check:
-                scheduler.add_job(push, 'date', run_date=next_check+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), **check_args)
-        if any([
-            'shouldStartAfter' in i.get('auctionPeriod', {}) and parse_date(i['auctionPeriod']['shouldStartAfter'], TZ).astimezone(TZ) > parse_date(i['auctionPeriod'].get('startDate', '0001'), TZ)
+        should_plan = any([
+            'shouldStartAfter' in i.get('auctionPeriod', {}) and parse_date(i['auctionPeriod']['shouldStartAfter'], TZ, TZ) > parse_date(i['auctionPeriod'].get('startDate', '0001'), TZ)
             for i in tender.get('lots', [])
         ]) or (
-            'shouldStartAfter' in tender.get('auctionPeriod', {}) and parse_date(tender['auctionPeriod']['shouldStartAfter'], TZ).astimezone(TZ) > parse_date(tender['auctionPeriod'].get('startDate', '0001'), TZ)
-        ):
-            resync_job = scheduler.get_job(tid)
-            if not resync_job or resync_job.next_run_time > run_date + timedelta(minutes=1):
-                scheduler.add_job(push, 'date', run_date=run_date+timedelta(seconds=randint(SMOOTHING_MIN, SMOOTHING_MAX)), timezone=TZ,
-                                  id=tid, name="Resync {}".format(tid),
-                                  misfire_grace_time=60 * 60,
-                                  args=[callback_url + 'resync/' + tid, None],
-                                  replace_existing=True)
+            'shouldStartAfter' in tender.get('auctionPeriod', {}) and parse_date(tender['auctionPeriod']['shouldStartAfter'], TZ, TZ) > parse_date(tender['auctionPeriod'].get('startDate', '0001'), TZ)
+        )
+        parsed.append((tender, next_check and parse_date(next_check, TZ, TZ), should_plan))
+    return parsed
 
 
-def resync_tenders(request):
-    next_url = request.params.get('url', '')
-    if not next_url or 'opt_fields=status%2CauctionPeriod%2Clots%2Cnext_check' not in next_url:
-        next_url = request.registry.api_url + 'tenders?mode=_all_&feed=changes&descending=1&opt_fields=status%2CauctionPeriod%2Clots%2Cnext_check'
-    scheduler = request.registry.scheduler
+def schedule_listing(parsed, scheduler):
+    run_date = get_now()
+    tids = [tender['id'] for tender, _, _ in parsed]
+    jobs = lookup_jobs(scheduler, tids + ["recheck_{}".format(tid) for tid in tids])
+    with batch_jobs(scheduler):
+        for tender, next_check, should_plan in parsed:
+            schedule_tender(tender['id'], next_check, should_plan, scheduler, jobs, run_date)
+
+
+def owned_tenders(tenders, cluster=None):
+    if not cluster:
+        return tenders
+    return [tender for tender in tenders if cluster.owns(tender['id'])]
+
+
+def process_listing(tenders, scheduler, db, check=True, planner=None, cluster=None):
+    tenders = owned_tenders(tenders, cluster)
+    if check:
+        check_auctions(db, tenders, planner)
+    schedule_listing(parse_listing(tenders), scheduler)
+
+
+def schedule_tender(tid, next_check, should_plan, scheduler, jobs, run_date):
+    resync_job = jobs.get(tid)
+    recheck_job = jobs.get("recheck_{}".format(tid))
+    recheck_date = next_check and next_recheck_date(recheck_job or (resync_job if rechecks(resync_job) else None), next_check, run_date)
+    resync_date = None
+    if should_plan and not due_within(resync_job, run_date):
+        resync_date = SMOOTHER.pick(run_date, SMOOTHING_MIN, SMOOTHING_MAX)
+    schedule_jobs(scheduler, tid, resync_date, recheck_date, resync_job, recheck_job)
+
+
+def fetch_listing(request, url, state, next_page=None):
+    """Yield (tenders, next_url) of feed pages starting from url."""
     api_token = request.registry.api_token
-    callback_url = request.registry.callback_url
     request_id = request.environ.get('REQUEST_ID', '')
     while True:
-        try:
-            r = get_request(next_url, auth=(api_token, ''), headers={'X-Client-Request-ID': request_id})
-            if r.status_code == requests.codes.not_found:
-                next_url = ''
-                break
-            elif r.status_code != requests.codes.ok:
-                break
-            else:
-                json = r.json()
-                next_url = json['next_page']['uri']
-                if "descending=1" in next_url:
-                    run_date = get_now()
-                    scheduler.add_job(push, 'date', run_date=run_date, timezone=TZ,
-                                      id='resync_back', name="Resync back", misfire_grace_time=60 * 60,
-                                      args=[callback_url + 'resync_back', {'url': next_url}],
-                                      replace_existing=True)
-                    next_url = json['prev_page']['uri']
-            if not json['data']:
-                break
-            process_listing(json['data'], scheduler, callback_url, request.registry.db)
-            sleep(0.1)
-        except Exception as e:
-            LOGGER.error("Error on resync all: {}".format(repr(e)), extra=context_unpack(request, {'MESSAGE_ID': 'error_resync_all'}))
-            break
+        r = get_request(url, auth=(api_token, ''), headers={'X-Client-Request-ID': request_id})
+        if r.status_code == requests.codes.not_found:
+            yield [], ''
+            return
+        elif r.status_code != requests.codes.ok:
+            return
+        json = r.json()
+        url = next_page(json) if next_page else json['next_page']['uri']
+        yield json['data'], url
+        if not json['data']:
+            state['stopped'] = True
+            return
+
+
+def sync_listing(request, url, check=True, next_page=None, cursor=None):
+    """Fetch, check and schedule feed pages from url in a pipeline."""
+    registry = request.registry
+    state = {'url': url, 'stopped': False, 'error': None, 'tenders': 0}
+
+    def parse(page):
+        tenders, next_url = page
+        return parse_listing(owned_tenders(tenders, registry.cluster)), next_url, tenders
+
+    def check_slots(page):
+        check_auctions(registry.db, [tender for tender, _, _ in page[0]], registry.planner)
+        return page
+
+    def schedule(page):
+        parsed, next_url, tenders = page
+        schedule_listing(parsed, registry.scheduler)
+        state['url'] = next_url
+        state['tenders'] += len(tenders)
+        if cursor and next_url:
+            save_cursor(registry.db, registry.sync_id, cursor, next_url, tenders)
+
+    stages = [parse, check_slots, schedule] if check else [parse, schedule]
+    try:
+        run_pipeline(fetch_listing(request, url, state, next_page), stages, registry.sync_queue_size)
+    except Exception as e:
+        state['error'] = e
+    return state
+
+
+def tender_job_id(job_id):
+    """Return the tender id of a resync or recheck job id."""
+    if job_id.startswith('recheck_'):
+        return job_id[len('recheck_'):]
+    if job_id not in ('resync_all', 'resync_back'):
+        return job_id
+
+
+def rebalance_jobs(scheduler, callback_url, cluster, db=None, sync_id=SYNC_ID):
+    """Drop jobs of tenders of other nodes, rescan if tenders gained."""
+    for job in scheduler.get_jobs():
+        tender_id = tender_job_id(job.id)
+        if tender_id and not cluster.owns(tender_id):
+            job.remove()
+    if not cluster.gained:
+        return
+    backward = get_sync(db, sync_id).get('backward', {}) if db is not None else {}
+    params = {'url': backward['url']} if backward.get('url') and not backward.get('stopped') else None
+    scheduler.add_job(push, 'date', run_date=get_now(), timezone=TZ,
+                      id='resync_back', name="Resync back", misfire_grace_time=60 * 60,
+                      args=[callback_url + 'resync_back', params],
+                      replace_existing=True)
+
+
+def with_opt_fields(url):
+    """Return the feed url with the missing `OPT_FIELDS` added."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    fields = [i for key, value in query if key == 'opt_fields' for i in value.split(',') if i]
+    missing = [i for i in OPT_FIELDS if i not in fields]
+    if not missing:
+        return url
+    query = [(key, value) for key, value in query if key != 'opt_fields'] + [('opt_fields', ','.join(fields + missing))]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def sync_forward(request, url=''):
+    """Process the feed forward from url."""
+    url = with_opt_fields(url) if url else request.registry.api_url + FEED_HEAD
+    scheduler = request.registry.scheduler
+    callback_url = request.registry.callback_url
+
+    def next_page(json):
+        next_url = json['next_page']['uri']
+        if "descending=1" in next_url:
+            run_date = get_now()
+            scheduler.add_job(push, 'date', run_date=run_date, timezone=TZ,
+                              id='resync_back', name="Resync back", misfire_grace_time=60 * 60,
+                              args=[callback_url + 'resync_back', {'url': next_url}],
+                              replace_existing=True)
+            next_url = json['prev_page']['uri']
+        return next_url
+
+    return sync_listing(request, url, next_page=next_page, cursor='forward')
+
+
+def resync_tenders(request):
+    # the feed follower owns the forward cursor when it runs
+    follower = getattr(request.registry, 'follower', None)
+    if follower:
+        follower.poll()
+        return follower.url
+    scheduler = request.registry.scheduler
+    callback_url = request.registry.callback_url
+    state = sync_forward(request, request.params.get('url', ''))
+    next_url = state['url']
+    if state['error']:
+        LOGGER.error("Error on resync all: {}".format(repr(state['error'])), extra=context_unpack(request, {'MESSAGE_ID': 'error_resync_all'}))
     run_date = get_now() + timedelta(minutes=1)
     scheduler.add_job(push, 'date', run_date=run_date, timezone=TZ,
                       id='resync_all', name="Resync all",
@@ -445,30 +963,17 @@ def resync_tenders(request):
 def resync_tenders_back(request):
     next_url = request.params.get('url', '')
     if not next_url:
-        next_url = request.registry.api_url + 'tenders?mode=_all_&feed=changes&descending=1&opt_fields=status%2CauctionPeriod%2Clots%2Cnext_check'
+        next_url = request.registry.api_url + FEED_HEAD
     scheduler = request.registry.scheduler
-    api_token = request.registry.api_token
     callback_url = request.registry.callback_url
-    request_id = request.environ.get('REQUEST_ID', '')
     LOGGER.info("Resync back started", extra=context_unpack(request, {'MESSAGE_ID': 'resync_back_started'}))
-    while True:
-        try:
-            r = get_request(next_url, auth=(api_token, ''), headers={'X-Client-Request-ID': request_id})
-            if r.status_code == requests.codes.not_found:
-                next_url = ''
-                break
-            elif r.status_code != requests.codes.ok:
-                break
-            json = r.json()
-            next_url = json['next_page']['uri']
-            if not json['data']:
-                LOGGER.info("Resync back stopped", extra=context_unpack(request, {'MESSAGE_ID': 'resync_back_stoped'}))
-                return next_url
-            process_listing(json['data'], scheduler, callback_url, request.registry.db, False)
-            sleep(0.1)
-        except Exception as e:
-            LOGGER.error("Error on resync back: {}".format(repr(e)), extra=context_unpack(request, {'MESSAGE_ID': 'error_resync_back'}))
-            break
+    state = sync_listing(request, next_url, check=False, cursor='backward')
+    next_url = state['url']
+    if state['error']:
+        LOGGER.error("Error on resync back: {}".format(repr(state['error'])), extra=context_unpack(request, {'MESSAGE_ID': 'error_resync_back'}))
+    elif state['stopped']:
+        LOGGER.info("Resync back stopped", extra=context_unpack(request, {'MESSAGE_ID': 'resync_back_stoped'}))
+        return next_url
     LOGGER.info("Resync back break", extra=context_unpack(request, {'MESSAGE_ID': 'resync_back_break'}))
     run_date = get_now() + timedelta(minutes=1)
     scheduler.add_job(push, 'date', run_date=run_date, timezone=TZ,
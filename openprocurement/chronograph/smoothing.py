@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from apscheduler.util import datetime_to_utc_timestamp
+from datetime import timedelta
+from random import randint
+from time import time
+
+
+class Smoother(object):
+    """Spreads job run times over the least loaded seconds.
+
+    A histogram of upcoming job fires per second is kept from the jobs
+    added. `pick` returns a time `low` to `high` seconds after start, in
+    the second of that window with the fewest fires (ties are broken at
+    random). When every second of the window already has `max_rate` fires,
+    the window is extended by up to `max_delay` seconds to the first second
+    below the limit. A `max_rate` of 0 disables the limit.
+    """
+
+    options = (
+        ('max_rate', int),
+        ('max_delay', int),
+    )
+
+    def __init__(self, max_rate=0, max_delay=3600, prune_interval=60):
+        self.max_rate = max_rate
+        self.max_delay = max_delay
+        self.prune_interval = prune_interval
+        self.counts = {}
+        self.pruned = time()
+
+    def configure(self, settings, prefix='smoothing.'):
+        for name, cast in self.options:
+            if prefix + name in settings:
+                setattr(self, name, cast(settings[prefix + name]))
+
+    def pick(self, start, low, high):
+        base = int(datetime_to_utc_timestamp(start))
+        counts = self.counts
+        span = high - low + 1
+        first = randint(0, span - 1)
+        best, best_count = None, None
+        for i in xrange(span):
+            second = low + (first + i) % span
+            count = counts.get(base + second, 0)
+            if best is None or count < best_count:
+                best, best_count = second, count
+                if not count:
+                    break
+        if self.max_rate and best_count >= self.max_rate:
+            for second in xrange(high + 1, high + 1 + self.max_delay):
+                if counts.get(base + second, 0) < self.max_rate:
+                    best = second
+                    break
+        return start + timedelta(seconds=best)
+
+    def add(self, run_time):
+        if run_time is None:
+            return
+        key = int(datetime_to_utc_timestamp(run_time))
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if time() - self.pruned > self.prune_interval:
+            self.prune()
+
+    def discard(self, run_time):
+        if run_time is None:
+            return
+        key = int(datetime_to_utc_timestamp(run_time))
+        count = self.counts.get(key, 0)
+        if count > 1:
+            self.counts[key] = count - 1
+        elif count:
+            del self.counts[key]
+
+    def due(self, seconds, now=None):
+        """Return the number of fires in the `seconds` from now on."""
+        now = int(time() if now is None else now)
+        counts = self.counts
+        return sum([counts.get(now + i, 0) for i in xrange(seconds)])
+
+    def load(self, run_times):
+        for run_time in run_times:
+            self.add(run_time)
+
+    def prune(self):
+        """Drop the seconds that already passed."""
+        now = int(time())
+        for key in [i for i in self.counts if i < now]:
+            del self.counts[key]
+        self.pruned = time()
@@ -96,7 +96,7 @@ class BaseWebTest(unittest.TestCase):
             auth = None
             if 'auth' in kwargs:
                 auth = kwargs.pop('auth')
-            for i in ['auth', 'allow_redirects', 'stream']:
+            for i in ['auth', 'allow_redirects', 'stream', 'timeout']:
                 if i in kwargs:
                     kwargs.pop(i)
             try:
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of listing sync against a local fake tenders API.
+
+Runs a full resync of a synthetic `feed=changes` listing through
+`resync_tenders_back` (newest to oldest, without slot checks) and
+`resync_tenders` (oldest to newest, with slot checks), and reports pages
+per second, jobs written per second and peak memory:
+
+    python -m openprocurement.chronograph.tests.bench_listing --tenders 100000 --latency 0.05 --error-rate 0.01
+"""
+import gevent.monkey
+gevent.monkey.patch_all()
+import argparse
+import logging
+import os
+import resource
+import tempfile
+from apscheduler.events import EVENT_JOB_ADDED
+from apscheduler.schedulers.base import BaseScheduler
+from datetime import datetime
+from json import dumps
+from timeit import default_timer
+
+from openprocurement.chronograph.jobstores import CouchDBJobStore, SQLAlchemyJobStore, TimerWheelJobStore
+from openprocurement.chronograph.scheduler import RETRY, TZ, JobRequest, resync_tenders, resync_tenders_back
+from openprocurement.chronograph.tests.fakeapi import FakeTendersAPI
+from openprocurement.chronograph.tests.memdb import MemoryDatabase
+
+SCENARIOS = ('resync_back', 'resync_all')
+FEED = 'tenders?mode=_all_&feed=changes&opt_fields=status%2CauctionPeriod%2Clots%2Cnext_check'
+
+
+class IdleScheduler(BaseScheduler):
+    """Scheduler that stores jobs without ever running them."""
+
+    def shutdown(self, wait=True):
+        super(IdleScheduler, self).shutdown(wait)
+
+    def wakeup(self):
+        pass
+
+
+class Registry(object):
+
+    def __init__(self, api_url, db, scheduler, sync_queue_size=2):
+        self.api_url = api_url
+        self.api_token = ''
+        self.callback_url = 'http://localhost/'
+        self.db = db
+        self.scheduler = scheduler
+        self.planner = None
+        self.cluster = None
+        self.sync_id = 'sync'
+        self.sync_queue_size = sync_queue_size
+
+
+def peak_rss():
+    """Peak resident set size of the process in megabytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def make_scheduler(jobstore, path=None):
+    jobstores = {}
+    if jobstore == 'couchdb':
+        jobstores['default'] = CouchDBJobStore(MemoryDatabase('jobs'))
+    elif jobstore == 'sqlite':
+        jobstores['default'] = SQLAlchemyJobStore(url='sqlite:///' + path)
+    elif jobstore == 'wheel':
+        jobstores['default'] = TimerWheelJobStore()
+    scheduler = IdleScheduler(jobstores=jobstores, timezone=TZ)
+    scheduler.start()
+    return scheduler
+
+
+def run_sync(api, registry, job_id, func, url=None, max_runs=1000):
+    """Call func the way its job would run until the API served the end of
+    the feed; a broken sync continues from the url of the job it
+    scheduled. Returns the number of runs."""
+    scheduler = registry.scheduler
+    api.drained = False
+    runs = 0
+    while not api.drained and runs < max_runs:
+        runs += 1
+        func(JobRequest(registry, job_id, {'url': url} if url else {}))
+        job = scheduler.get_job(job_id)
+        url = job and job.args[1] and job.args[1].get('url')
+        if job:
+            scheduler.remove_job(job_id)
+    return runs
+
+
+def bench(api, scenario, jobstore='memory', queue_size=2):
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    scheduler = make_scheduler(jobstore, path)
+    registry = Registry(api.url, MemoryDatabase(), scheduler, queue_size)
+    written = []
+    scheduler.add_listener(lambda event: written.append(event.job_id), EVENT_JOB_ADDED)
+    pages, errors = api.pages, api.errors
+    started = default_timer()
+    if scenario == 'resync_back':
+        runs = run_sync(api, registry, 'resync_back', resync_tenders_back)
+    else:
+        runs = run_sync(api, registry, 'resync_all', resync_tenders, api.url + FEED)
+    elapsed = default_timer() - started
+    jobs = len(scheduler.get_jobs())
+    scheduler.shutdown()
+    os.remove(path)
+    pages = api.pages - pages
+    return {
+        'scenario': scenario,
+        'jobstore': jobstore,
+        'runs': runs,
+        'pages': pages,
+        'errors': api.errors - errors,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 1),
+        'jobs_written': len(written),
+        'jobs_written_per_sec': round(len(written) / elapsed, 1),
+        'jobs': jobs,
+        'peak_rss_mb': round(peak_rss(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='---- Chronograph Listing Benchmark ----')
+    parser.add_argument('--tenders', type=int, default=100000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0, help='Seconds each API request takes')
+    parser.add_argument('--error-rate', type=float, default=0, help='Share of API requests failing with 503')
+    parser.add_argument('--jobstore', default='memory', choices=('memory', 'sqlite', 'couchdb', 'wheel'))
+    parser.add_argument('--queue-size', type=int, default=2, help='Pages buffered between sync stages')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_listing.jsonl', help='File the results are appended to')
+    params = parser.parse_args()
+    logging.getLogger('openprocurement.chronograph').setLevel(logging.CRITICAL)
+    RETRY.base_delay = RETRY.max_delay = 0.01
+    api = FakeTendersAPI(params.tenders, params.page_size, params.latency, params.error_rate, seed=params.seed)
+    server = api.serve()
+    run = {'time': datetime.now(TZ).isoformat(), 'params': vars(params), 'results': []}
+    for scenario in params.scenario or SCENARIOS:
+        result = bench(api, scenario, params.jobstore, params.queue_size)
+        run['results'].append(result)
+        print(dumps(result, sort_keys=True))
+    server.stop()
+    with open(params.output, 'a') as f:
+        f.write(dumps(run, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
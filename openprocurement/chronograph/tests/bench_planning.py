@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""Offline benchmark of auction planning.
+
+Plans synthetic tenders against an in-memory database with holidays,
+pre-filled full days and freed slots, and reports plans per second,
+latency percentiles and document reads/writes per plan (including the
+plan index's reads of the changes feed). Results are appended to a JSON
+lines file and compared with the previous run of the same parameters:
+
+    python -m openprocurement.chronograph.tests.bench_planning --tenders 500 --lots 3 --streams 10
+"""
+import gevent.monkey
+gevent.monkey.patch_all()
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+from gevent import joinall, sleep, spawn
+from json import dumps, loads
+from random import Random
+from timeit import default_timer
+
+from openprocurement.chronograph.index import PlanIndex
+from openprocurement.chronograph.planner import Planner
+from openprocurement.chronograph.scheduler import (
+    CALENDAR_ID,
+    STREAMS_ID,
+    TZ,
+    WORKING_DAY_END,
+    JobRequest,
+    check_tender,
+    find_free_slot,
+    free_slots,
+    get_plan_id,
+    planning_auction,
+    planning_lots,
+)
+from openprocurement.chronograph.tests.memdb import MemoryDatabase
+
+SCENARIOS = ('planning_auction', 'planning_lots', 'planner', 'check_tender', 'freed_slots', 'find_free_slot')
+
+
+class Registry(object):
+
+    def __init__(self, db, planner):
+        self.db = db
+        self.planner = planner
+        self.api_url = 'http://localhost/api/'
+        self.callback_url = 'http://localhost/'
+
+
+class Bench(object):
+
+    def __init__(self, tenders=200, lots=3, streams=10, holidays=0.1, full_days=2, freed=0.1, index=True, seed=0):
+        self.tenders = tenders
+        self.lots = lots
+        self.streams = streams
+        self.holidays = holidays
+        self.full_days = full_days
+        self.freed = freed
+        self.index = index
+        self.random = Random(seed)
+        today = datetime.now(TZ).replace(hour=9, minute=0, second=0, microsecond=0)
+        self.start = today + timedelta(days=7 - today.weekday())
+
+    def params(self):
+        return dict([(i, getattr(self, i)) for i in ('tenders', 'lots', 'streams', 'holidays', 'full_days', 'freed', 'index')])
+
+    def setup(self):
+        """Return a database with streams, a calendar with random holidays
+        and the first working days of the plan already full."""
+        db = MemoryDatabase()
+        db.save({'_id': STREAMS_ID, 'streams': self.streams})
+        calendar = {'_id': CALENDAR_ID}
+        for n in range(1, 366):
+            if self.random.random() < self.holidays:
+                calendar[(self.start + timedelta(days=n)).date().isoformat()] = True
+        db.save(calendar)
+        day, full = self.start.date(), 0
+        while full < self.full_days:
+            if day.weekday() < 5 and day.isoformat() not in calendar:
+                db.save({'_id': get_plan_id('', day), 'time': WORKING_DAY_END.isoformat(), 'streams': self.streams})
+                full += 1
+            day += timedelta(days=1)
+        index = None
+        if self.index:
+            index = PlanIndex(db, watch=(CALENDAR_ID, STREAMS_ID))
+            index.load()
+            index.start()
+        self.following = index
+        self.reset(db)
+        return db, index
+
+    def drain(self):
+        """Let the plan index follower read the pending changes."""
+        if self.following:
+            sleep(0.01)
+
+    def reset(self, db):
+        self.drain()
+        db.reads = db.writes = 0
+
+    def tender(self, n, lots=0):
+        tender = {'id': '{:032x}'.format(n), 'mode': ''}
+        should_start_after = (self.start + timedelta(hours=self.random.randint(0, 72))).isoformat()
+        if lots:
+            tender['lots'] = [
+                {'id': '{:032x}'.format(i), 'status': 'active', 'auctionPeriod': {'shouldStartAfter': should_start_after}}
+                for i in range(lots)
+            ]
+        else:
+            tender['auctionPeriod'] = {'shouldStartAfter': should_start_after}
+        return tender
+
+    def measure(self, name, db, calls, plans_per_call=1):
+        latencies = []
+        started = default_timer()
+        for call in calls:
+            start = default_timer()
+            call()
+            latencies.append(default_timer() - start)
+            if self.following:
+                sleep(0)
+        return self.report(name, db, default_timer() - started, latencies, plans_per_call)
+
+    def report(self, name, db, elapsed, latencies, plans_per_call=1):
+        self.drain()
+        if self.following:
+            self.following.stop()
+        latencies = sorted(latencies)
+        plans = len(latencies) * plans_per_call
+        return {
+            'scenario': name,
+            'plans': plans,
+            'seconds': round(elapsed, 4),
+            'plans_per_sec': round(plans / elapsed, 1) if elapsed else None,
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+            'p99_ms': round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 3),
+            'reads_per_plan': round(float(db.reads) / plans, 3),
+            'writes_per_plan': round(float(db.writes) / plans, 3),
+        }
+
+    def planning_auction(self):
+        db, index = self.setup()
+        tenders = [self.tender(n) for n in range(self.tenders)]
+        calls = [
+            lambda tender=tender: planning_auction(tender, self.start, db, index=index)
+            for tender in tenders
+        ]
+        return self.measure('planning_auction', db, calls)
+
+    def planning_lots(self):
+        db, index = self.setup()
+        tenders = [self.tender(n, self.lots) for n in range(self.tenders)]
+        calls = [
+            lambda tender=tender: planning_lots(tender, [(lot['id'], self.start) for lot in tender['lots']], db, index=index)
+            for tender in tenders
+        ]
+        return self.measure('planning_lots', db, calls, self.lots)
+
+    def planner(self):
+        db, index = self.setup()
+        planner = Planner(db, index)
+        tenders = [self.tender(n, self.lots) for n in range(self.tenders)]
+        latencies = []
+
+        def plan(tender):
+            start = default_timer()
+            planner.plan_lots(tender, [(lot['id'], self.start) for lot in tender['lots']])
+            latencies.append(default_timer() - start)
+
+        started = default_timer()
+        joinall([spawn(plan, tender) for tender in tenders], raise_error=True)
+        return self.report('planner', db, default_timer() - started, latencies, self.lots)
+
+    def check_tender(self):
+        db, index = self.setup()
+        registry = Registry(db, Planner(db, index))
+        tenders = [self.tender(n) for n in range(self.tenders)]
+        calls = [
+            lambda tender=tender: check_tender(JobRequest(registry, 'resync/' + tender['id']), tender, db)
+            for tender in tenders
+        ]
+        return self.measure('check_tender', db, calls)
+
+    def freed_slots(self):
+        """Plan tenders, release a share of their slots and plan again into
+        the freed slots."""
+        db, index = self.setup()
+        tenders = [self.tender(n) for n in range(self.tenders)]
+        booked = [(tender, planning_auction(tender, self.start, db, index=index)[0]) for tender in tenders]
+        released = self.random.sample(booked, int(len(booked) * self.freed)) or booked[:1]
+        free_slots(db, [(get_plan_id('', start.date()), start, tender['id']) for tender, start in released], index)
+        self.reset(db)
+        calls = [
+            lambda n=n: planning_auction(self.tender(self.tenders + n), self.start, db, index=index)
+            for n in range(len(released))
+        ]
+        return self.measure('freed_slots', db, calls)
+
+    def find_free_slot(self):
+        db, index = self.setup()
+        tenders = [self.tender(n) for n in range(self.tenders)]
+        booked = [(tender, planning_auction(tender, self.start, db, index=index)[0]) for tender in tenders]
+        day = booked[0][1].date()
+        released = [(get_plan_id('', day), start, tender['id']) for tender, start in booked if start.date() == day]
+        free_slots(db, released, index)
+        plan = db.get(get_plan_id('', day))
+        self.reset(db)
+        calls = [lambda: find_free_slot(dict(plan, free=list(plan['free'])))] * self.tenders
+        return self.measure('find_free_slot', db, calls)
+
+    def run(self, scenarios=SCENARIOS):
+        return [getattr(self, name)() for name in scenarios]
+
+
+def compare(previous, results):
+    before = dict([(i['scenario'], i) for i in previous['results']])
+    for result in results:
+        old = before.get(result['scenario'])
+        if old and old['plans_per_sec'] and result['plans_per_sec']:
+            result['change'] = '{:+.1f}%'.format((result['plans_per_sec'] / old['plans_per_sec'] - 1) * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='---- Chronograph Planning Benchmark ----')
+    parser.add_argument('--tenders', type=int, default=200)
+    parser.add_argument('--lots', type=int, default=3)
+    parser.add_argument('--streams', type=int, default=10)
+    parser.add_argument('--holidays', type=float, default=0.1, help='Share of days that are holidays')
+    parser.add_argument('--full-days', type=int, default=2, help='Working days already full')
+    parser.add_argument('--freed', type=float, default=0.1, help='Share of slots freed and planned again')
+    parser.add_argument('--no-index', dest='index', action='store_false', help='Plan without the plan index')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS)
+    parser.add_argument('--output', default='bench_planning.jsonl', help='File the results are appended to')
+    params = parser.parse_args()
+    logging.getLogger('openprocurement.chronograph').setLevel(logging.WARNING)
+    bench = Bench(params.tenders, params.lots, params.streams, params.holidays, params.full_days, params.freed, params.index)
+    results = bench.run(params.scenario or SCENARIOS)
+    run = {'time': datetime.now(TZ).isoformat(), 'params': bench.params(), 'results': results}
+    previous = None
+    if os.path.isfile(params.output):
+        with open(params.output) as f:
+            runs = [loads(line) for line in f if line.strip()]
+        previous = ([i for i in runs if i['params'] == run['params']] or [None])[-1]
+    if previous:
+        compare(previous, results)
+    for result in results:
+        print(dumps(result, sort_keys=True))
+    with open(params.output, 'a') as f:
+        f.write(dumps(run, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from gevent import sleep
+from gevent.pywsgi import WSGIServer
+from hashlib import md5
+from json import dumps, loads
+from pytz import timezone
+from random import Random
+from urllib import urlencode
+from urlparse import parse_qsl
+
+TZ = timezone('Europe/Kiev')
+
+
+class FakeTendersAPI(object):
+    """WSGI stand-in for the tenders API.
+
+    Serves a synthetic `feed=changes` listing of `count` tenders (the
+    position in the feed is the page offset), single tenders and tender
+    PATCHes under `/api/0/`. Each request waits `latency` seconds and fails
+    with 503 with probability `error_rate`. Tenders are generated from
+    their position, so the listing costs no memory besides their ids.
+    """
+
+    def __init__(self, count=100000, page_size=100, latency=0, error_rate=0, plan_share=0.3, lots_share=0.3, check_share=0.5, seed=0):
+        self.count = count
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.plan_share = plan_share
+        self.lots_share = lots_share
+        self.check_share = check_share
+        self.seed = seed
+        self.random = Random(seed)
+        self.start = datetime.now(TZ).replace(microsecond=0)
+        self.url = 'http://localhost/api/0/'
+        self.ids = [md5('{}:{}'.format(seed, n)).hexdigest() for n in xrange(count)]
+        self.positions = dict([(tender_id, n) for n, tender_id in enumerate(self.ids)])
+        self.requests = 0
+        self.pages = 0
+        self.errors = 0
+        self.drained = False
+
+    def tender(self, n, fields=None):
+        rnd = Random(self.seed * 1000003 + n)
+        day = self.start + timedelta(days=rnd.randint(1, 30), hours=rnd.randint(0, 23))
+        tender = {
+            'id': self.ids[n],
+            'dateModified': (self.start - timedelta(seconds=self.count - n)).isoformat(),
+            'status': 'active.tendering',
+        }
+        if rnd.random() < self.check_share:
+            tender['next_check'] = day.isoformat()
+        period = {}
+        if rnd.random() < self.plan_share:
+            period['shouldStartAfter'] = day.isoformat()
+        if rnd.random() < self.lots_share:
+            tender['lots'] = [
+                {'id': md5('{}:{}'.format(self.ids[n], i)).hexdigest(), 'status': 'active', 'auctionPeriod': dict(period)}
+                for i in range(rnd.randint(1, 3))
+            ]
+        else:
+            tender['auctionPeriod'] = period
+        if fields is not None:
+            tender = dict([(k, v) for k, v in tender.items() if k in fields or k in ('id', 'dateModified')])
+        return tender
+
+    def page(self, params):
+        """Return the listing page for query params.
+
+        `offset` is the feed position the page starts after (before, when
+        descending); a page without offset starts at the head of the feed.
+        """
+        descending = bool(params.get('descending'))
+        limit = int(params.get('limit', self.page_size))
+        fields = params['opt_fields'].split(',') if params.get('opt_fields') else []
+        if 'offset' in params:
+            offset = int(params['offset'])
+        else:
+            offset = self.count if descending else -1
+        if descending:
+            positions = range(offset - 1, max(offset - 1 - limit, -1), -1)
+        else:
+            positions = range(offset + 1, min(offset + 1 + limit, self.count))
+        last = positions[-1] if positions else offset
+        first = positions[0] if positions else offset
+        base = dict([(k, v) for k, v in params.items() if k not in ('offset', 'descending')])
+        next_params = dict(base, offset=last)
+        prev_params = dict(base, offset=first)
+        if descending:
+            next_params['descending'] = 1
+        else:
+            prev_params['descending'] = 1
+        return {
+            'data': [self.tender(n, set(fields) if fields else ()) for n in positions],
+            'next_page': {'uri': self.url + 'tenders?' + urlencode(sorted(next_params.items()))},
+            'prev_page': {'uri': self.url + 'tenders?' + urlencode(sorted(prev_params.items()))},
+        }
+
+    def respond(self, start_response, status, body):
+        data = dumps(body)
+        start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(data)))])
+        return [data]
+
+    def __call__(self, environ, start_response):
+        self.requests += 1
+        if self.latency:
+            sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return self.respond(start_response, '503 Service Unavailable', {'status': 'error', 'errors': [{'description': 'Service Unavailable'}]})
+        path = environ['PATH_INFO'].rstrip('/').split('/')
+        method = environ['REQUEST_METHOD']
+        if path[1:4] == ['api', '0', 'tenders'] and len(path) == 4 and method == 'GET':
+            self.pages += 1
+            page = self.page(dict(parse_qsl(environ.get('QUERY_STRING', ''))))
+            if not page['data']:
+                self.drained = True
+            return self.respond(start_response, '200 OK', page)
+        if path[1:4] == ['api', '0', 'tenders'] and len(path) == 5 and path[4] in self.positions:
+            tender = self.tender(self.positions[path[4]])
+            if method == 'PATCH':
+                changes = loads(environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0)) or '{}').get('data', {})
+                tender.update(changes)
+            return self.respond(start_response, '200 OK', {'data': tender})
+        return self.respond(start_response, '404 Not Found', {'status': 'error', 'errors': [{'description': 'Not Found'}]})
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Start serving on a background greenlet; returns the server."""
+        server = WSGIServer((host, port), self, log=None)
+        server.start()
+        self.url = 'http://{}:{}/api/0/'.format(host, server.server_port)
+        return server
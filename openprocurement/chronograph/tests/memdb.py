@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+from copy import deepcopy
+from couchdb.client import Document, Row
+from couchdb.http import ResourceConflict, ResourceNotFound
+from gevent.event import Event
+from hashlib import md5
+from json import dumps
+from openprocurement.chronograph.jobstores import JOB_PREFIX, SUMMARY_BUCKET, job_kind
+
+
+def plan_slots(doc):
+    if not doc.get('streams'):
+        return
+    for i in doc:
+        if i.startswith('stream_'):
+            for t, tender_id in doc[i].items():
+                if tender_id:
+                    yield tender_id.split('_'), doc['_id'].split('_')[1] + 'T' + t
+
+
+def plan_tenders_map(doc):
+    for x, value in plan_slots(doc):
+        yield x if len(x) == 2 else [x[0], None], value
+
+
+def plan_tender_ids_map(doc):
+    for x, value in plan_slots(doc):
+        yield x[0], [x[1] if len(x) == 2 else None, value]
+
+
+def jobs_next_run_time_map(doc):
+    if doc['_id'].startswith(JOB_PREFIX) and doc.get('next_run_time') is not None:
+        yield doc['next_run_time'], None
+
+
+def jobs_ids_map(doc):
+    if doc['_id'].startswith(JOB_PREFIX):
+        yield doc['_id'], doc.get('next_run_time')
+
+
+def jobs_summary_map(doc):
+    if doc['_id'].startswith(JOB_PREFIX):
+        next_run_time = doc.get('next_run_time')
+        bucket = None if next_run_time is None else int(next_run_time // SUMMARY_BUCKET)
+        yield [job_kind(doc['_id'][len(JOB_PREFIX):]), bucket], None
+
+
+def plan_index_filter(doc_id, options):
+    watch = options.get('watch', '').split(',')
+    return doc_id.startswith('plan') or doc_id in watch
+
+
+FILTERS = {
+    'plan/index': plan_index_filter,
+}
+
+VIEWS = {
+    'plan/tenders': (plan_tenders_map, None),
+    'plan/tender_ids': (plan_tender_ids_map, None),
+    'jobs/next_run_time': (jobs_next_run_time_map, None),
+    'jobs/ids': (jobs_ids_map, None),
+    'jobs/summary': (jobs_summary_map, '_count'),
+}
+
+
+class MemoryDatabase(object):
+    """In-memory stand-in for `couchdb.Database` used by benchmarks.
+
+    Supports the document, bulk, `_all_docs`, `_changes` and design view
+    calls made by chronograph, with revision checks, and counts document
+    reads and writes (a bulk or view request counts as one, every change
+    delivered by `changes` as one read).
+    """
+
+    def __init__(self, name='chronograph'):
+        self.name = name
+        self.docs = {}
+        self.seq = 0
+        self.log = []
+        self.reads = 0
+        self.writes = 0
+        self.changed = Event()
+
+    def info(self):
+        return {'db_name': self.name, 'update_seq': self.seq, 'doc_count': len(self.docs)}
+
+    def __contains__(self, doc_id):
+        return doc_id in self.docs
+
+    def get(self, doc_id, default=None):
+        self.reads += 1
+        doc = self.docs.get(doc_id)
+        return Document(deepcopy(doc)) if doc else default
+
+    def _save(self, doc):
+        current = self.docs.get(doc['_id'])
+        if current and current['_rev'] != doc.get('_rev') or not current and doc.get('_rev'):
+            raise ResourceConflict(('conflict', 'Document update conflict.'))
+        number = int(current['_rev'].split('-')[0]) + 1 if current else 1
+        doc['_rev'] = '{}-{}'.format(number, md5(dumps(doc, sort_keys=True)).hexdigest())
+        self.seq += 1
+        if doc.get('_deleted'):
+            self.docs.pop(doc['_id'], None)
+        else:
+            self.docs[doc['_id']] = deepcopy(doc)
+        self.log.append((self.seq, doc['_id'], doc.get('_deleted', False)))
+        self.changed.set()
+        return doc['_id'], doc['_rev']
+
+    def save(self, doc, **options):
+        self.writes += 1
+        if '_id' not in doc:
+            doc['_id'] = md5(str(self.seq) + dumps(doc, sort_keys=True)).hexdigest()
+        return self._save(doc)
+
+    def delete(self, doc):
+        self.writes += 1
+        if doc['_id'] not in self.docs:
+            raise ResourceNotFound(('not_found', 'deleted'))
+        self._save(dict(doc, _deleted=True))
+
+    def update(self, documents, **options):
+        self.writes += 1
+        results = []
+        for doc in documents:
+            try:
+                doc_id, rev = self._save(doc)
+            except ResourceConflict as e:
+                results.append((False, doc['_id'], e))
+            else:
+                results.append((True, doc_id, rev))
+        return results
+
+    def changes(self, **options):
+        since = options.get('since') or 0
+        if options.get('feed') != 'continuous':
+            return {'results': self._changes(since, options), 'last_seq': self.seq}
+        return self._follow(since, options)
+
+    def _changes(self, since, options):
+        latest = {}
+        accept = FILTERS[options['filter']] if options.get('filter') else None
+        for seq, doc_id, deleted in self.log:
+            if seq > since and (accept is None or accept(doc_id, options)):
+                latest[doc_id] = (seq, deleted)
+        results = []
+        for doc_id, (seq, deleted) in sorted(latest.items(), key=lambda i: i[1][0]):
+            change = {'seq': seq, 'id': doc_id}
+            if deleted:
+                change['deleted'] = True
+            elif options.get('include_docs'):
+                change['doc'] = deepcopy(self.docs.get(doc_id))
+            results.append(change)
+        self.reads += len(results)
+        return results
+
+    def _follow(self, since, options):
+        while True:
+            self.changed.clear()
+            for change in self._changes(since, options):
+                since = change['seq']
+                yield change
+            self.changed.wait(options.get('heartbeat', 1000) / 1000.)
+
+    def view(self, name, wrapper=None, **options):
+        self.reads += 1
+        if name == '_all_docs':
+            if 'keys' in options:
+                rows = [
+                    Row(id=key, key=key, value={'rev': self.docs[key]['_rev']}, doc=self.docs[key])
+                    if key in self.docs else Row(key=key, error='not_found')
+                    for key in options['keys']
+                ]
+                return self._rows(rows, options, filtered=True)
+            rows = [
+                Row(id=doc_id, key=doc_id, value={'rev': doc['_rev']}, doc=doc)
+                for doc_id, doc in sorted(self.docs.items())
+            ]
+            return self._rows(rows, options)
+        map_fun, reduce_fun = VIEWS[name]
+        rows = sorted([
+            Row(id=doc_id, key=key, value=value, doc=doc)
+            for doc_id, doc in self.docs.items()
+            for key, value in map_fun(doc)
+        ], key=lambda row: (row.key, row.id))
+        if 'keys' in options:
+            rows = [row for key in options['keys'] for row in rows if row.key == key]
+            return self._rows(rows, options, filtered=True)
+        if reduce_fun and options.get('reduce', True):
+            counts = {}
+            for row in self._rows(rows, options, reduced=True):
+                key = tuple(row.key) if options.get('group') else None
+                counts[key] = counts.get(key, 0) + 1
+            return [Row(key=list(key) if key else None, value=count) for key, count in sorted(counts.items())]
+        return self._rows(rows, options)
+
+    def _rows(self, rows, options, filtered=False, reduced=False):
+        if not filtered:
+            if 'key' in options:
+                rows = [row for row in rows if row.key == options['key']]
+            if 'startkey' in options:
+                rows = [row for row in rows if row.key >= options['startkey']]
+            if 'endkey' in options:
+                if options.get('inclusive_end', True):
+                    rows = [row for row in rows if row.key <= options['endkey']]
+                else:
+                    rows = [row for row in rows if row.key < options['endkey']]
+        if reduced:
+            return rows
+        rows = rows[options.get('skip', 0):]
+        if 'limit' in options:
+            rows = rows[:options['limit']]
+        for row in rows:
+            if options.get('include_docs') and row.get('doc'):
+                row['doc'] = deepcopy(row['doc'])
+            else:
+                row.pop('doc', None)
+        return rows
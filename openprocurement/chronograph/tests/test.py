@@ -1,14 +1,34 @@
 # -*- coding: utf-8 -*-
+import gevent
+import os
 import unittest
 from datetime import datetime, timedelta
 from copy import deepcopy
+from couchdb.http import ResourceConflict
 from iso8601 import parse_date
+from tempfile import mkstemp
 from time import sleep
 from logging import getLogger
+from gevent import joinall, spawn
+from gevent.queue import Empty, Queue
+from apscheduler.schedulers.gevent import GeventScheduler
+from apscheduler.util import datetime_to_utc_timestamp
 
 from openprocurement.chronograph import TZ
-from openprocurement.chronograph.scheduler import planning_auction, free_slot
+from openprocurement.chronograph import outbound as outbound_module, retry as retry_module, scheduler as scheduler_module
+from openprocurement.chronograph.cluster import Cluster
+from openprocurement.chronograph.follower import FeedFollower
+from openprocurement.chronograph.index import PlanIndex
+from openprocurement.chronograph.jobstores import CouchDBJobStore, JobRecord, SQLAlchemyJobStore, TimerWheelJobStore, iter_jobs, summarize_jobs
+from openprocurement.chronograph.outbound import Outbound, TokenBucket
+from openprocurement.chronograph.planner import DayWorker, Planner, Release
+from openprocurement.chronograph.retry import Retry, RetryBudgetExceeded
+from openprocurement.chronograph.smoothing import Smoother
+from openprocurement.chronograph.scheduler import check_auctions, planning_auction, planning_lots, free_slot, free_slots, RECHECK, process_listing, push, push_tender, PushFailed, rechecks, requeue_job, set_coalesce_window, set_dispatcher, sync_listing, with_opt_fields, JobRequest
 from openprocurement.chronograph.tests.base import BaseWebTest, BaseTenderWebTest, test_tender_data
+from openprocurement.chronograph.tests.memdb import MemoryDatabase
+from openprocurement.chronograph.utils import parse_date as parse_date_cached
+from openprocurement.chronograph.workdays import WorkingDays
 
 try:
     from openprocurement.api.tests.base import test_bids
@@ -65,6 +85,14 @@ test_tender_data_test_quick = deepcopy(test_tender_data_quick)
 test_tender_data_test_quick['mode'] = 'test'
 
 
+def tender_ids(count):
+    return ['{:032x}'.format(i) for i in range(count)]
+
+
+def tender_listing(count, next_check):
+    return [{'id': i, 'next_check': next_check} for i in tender_ids(count)]
+
+
 class SimpleTest(BaseWebTest):
 
     def test_list_jobs(self):
@@ -73,6 +101,14 @@ class SimpleTest(BaseWebTest):
         self.assertIn('jobs', response.json)
         self.assertEqual(len(response.json['jobs']), 1)
 
+    def test_metrics(self):
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual(response.content_type, 'text/plain')
+        self.assertIn('chronograph_jobs{kind="resync_all"} 1.0', response.body)
+        self.assertIn('# TYPE chronograph_job_fire_lag_seconds histogram', response.body)
+        self.assertIn('chronograph_jobs_due_per_minute{window="60"}', response.body)
+
     def test_resync_all(self):
         response = self.app.get('/resync_all')
         self.assertEqual(response.status, '200 OK')
@@ -83,6 +119,45 @@ class SimpleTest(BaseWebTest):
         self.assertEqual(response.status, '200 OK')
         self.assertNotEqual(response.json, None)
 
+    def test_sync(self):
+        response = self.app.get('/sync')
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual(response.json['forward']['next_run_time'], self.app.get('/').json['jobs']['resync_all'])
+        self.app.get('/resync_all')
+        response = self.app.get('/sync')
+        self.assertEqual(response.json['forward']['pages'], 1)
+        self.assertIn('lag', response.json['forward'])
+        self.assertIn('url', response.json['forward'])
+
+    def test_follow(self):
+        registry = self.app.app.registry
+        follower = FeedFollower(registry, min_delay=1, max_delay=4)
+        self.assertEqual(follower.poll(), 2)
+        self.assertIsNotNone(registry.scheduler.get_job('resync_back'))
+        self.assertEqual(self.app.get('/sync').json['forward']['url'], follower.url)
+        self.assertEqual(follower.poll(), 4)
+        self.assertEqual(follower.poll(), 4)
+
+    def test_resync_all_follow(self):
+        registry = self.app.app.registry
+        registry.scheduler.remove_job('resync_all')
+        registry.follower = FeedFollower(registry)
+        try:
+            response = self.app.get('/resync_all')
+            self.assertEqual(response.json, registry.follower.url)
+            self.assertIsNone(registry.scheduler.get_job('resync_all'))
+        finally:
+            registry.follower = None
+
+    def test_push_local(self):
+        registry = self.app.app.registry
+        set_dispatcher(registry)
+        try:
+            push(registry.callback_url + 'resync_all', None)
+        finally:
+            set_dispatcher(None)
+        self.assertIsNotNone(registry.scheduler.get_job('resync_back'))
+
     def test_resync_one(self):
         response = self.app.get('/resync/all')
         self.assertEqual(response.status, '200 OK')
@@ -147,6 +222,21 @@ class TendersTest(BaseTenderWebTest):
         self.assertEqual(len(response.json['jobs']), 2)
         self.assertIn("recheck_{}".format(self.tender_id), response.json['jobs'])
 
+    def test_jobs_api(self):
+        response = self.app.get('/recheck/' + self.tender_id)
+        self.assertEqual(response.status, '200 OK')
+        response = self.app.get('/jobs')
+        self.assertEqual([i['id'] for i in response.json['jobs']], ["recheck_{}".format(self.tender_id), 'resync_all'])
+        self.assertEqual(response.json['next'], None)
+        response = self.app.get('/jobs?kind=recheck&prefix={}&limit=1'.format(self.tender_id[:4]))
+        self.assertEqual([i['id'] for i in response.json['jobs']], ["recheck_{}".format(self.tender_id)])
+        response = self.app.get('/jobs?kind=recheck&limit=1&cursor=' + response.json['next'])
+        self.assertEqual(response.json, {'jobs': [], 'next': None})
+        response = self.app.get('/jobs?kind=unknown', status=400)
+        response = self.app.get('/jobs/summary')
+        self.assertEqual(response.json['kinds'], {'recheck': 1, 'resync_all': 1})
+        self.assertEqual(sum([i['count'] for i in response.json['buckets']]), 2)
+
     def test_resync_all(self):
         response = self.app.get('/resync_all')
         self.assertEqual(response.status, '200 OK')
@@ -625,6 +715,129 @@ class TenderPlanning(BaseWebTest):
         res = planning_auction(test_tender_data_test_quick, now, self.db)[0]
         self.assertEqual(res.time(), startTime)
 
+    def test_auction_planning_free_earliest(self):
+        now = datetime.now(TZ)
+        res = [planning_auction(test_tender_data_test_quick, now, self.db, lot_id=str(i))[0] for i in range(15)]
+        plan_id = "plantest_{}".format(res[0].date().isoformat())
+        free_slot(self.db, plan_id, res[12], "_12")
+        free_slot(self.db, plan_id, res[11], "_11")
+        self.assertEqual(len(self.db.get(plan_id)['free']), 2)
+        self.assertEqual(planning_auction(test_tender_data_test_quick, now, self.db)[0], min(res[11], res[12]))
+        self.assertEqual(planning_auction(test_tender_data_test_quick, now, self.db)[0], max(res[11], res[12]))
+        self.assertEqual(self.db.get(plan_id)['free'], [])
+
+    def test_auction_planning_index(self):
+        index = PlanIndex(self.db)
+        index.load()
+        now = datetime.now(TZ)
+        res = planning_auction(test_tender_data_test_quick, now, self.db, index=index)[0]
+        plan_id = "plantest_{}".format(res.date().isoformat())
+        self.assertEqual(index.get(plan_id)['_rev'], self.db.get(plan_id)['_rev'])
+        plan = self.db.get(plan_id)
+        self.db.save(plan)
+        with self.assertRaises(ResourceConflict):
+            planning_auction(test_tender_data_test_quick, now, self.db, index=index)
+        self.assertEqual(index.get(plan_id)['_rev'], plan['_rev'])
+        res2 = planning_auction(test_tender_data_test_quick, now, self.db, index=index)[0]
+        self.assertEqual(res2, res + timedelta(minutes=30))
+
+    def test_auction_planning_index_past(self):
+        today = datetime.now(TZ).date()
+        past_id = "plantest_{}".format((today - timedelta(days=1)).isoformat())
+        plan_id = "plantest_{}".format(today.isoformat())
+        self.db.save({'_id': past_id, 'streams': 1})
+        self.db.save({'_id': plan_id, 'streams': 1})
+        index = PlanIndex(self.db)
+        index.load()
+        self.assertNotIn(past_id, index.plans)
+        self.assertIsNone(index.get(past_id))
+        self.assertEqual(index.get(plan_id)['_rev'], self.db.get(plan_id)['_rev'])
+        index.update({'_id': plan_id, '_rev': '9-x', '_deleted': True})
+        self.assertEqual(index.get(plan_id)['_rev'], self.db.get(plan_id)['_rev'])
+
+    def test_auction_planning_lots(self):
+        now = datetime.now(TZ)
+        lots = [(i, now) for i in tender_ids(3)]
+        res = planning_lots(test_tender_data_test_quick, lots, self.db)
+        self.assertEqual(set(res), set([i for i, _ in lots]))
+        starts = sorted([i[0] for i in res.values()])
+        self.assertEqual(starts[1], starts[0] + timedelta(minutes=30))
+        self.assertEqual(starts[2], starts[1] + timedelta(minutes=30))
+        plan = self.db.get("plantest_{}".format(starts[0].date().isoformat()))
+        self.assertEqual(plan['_rev'].split('-')[0], '1')
+        self.assertEqual(plan['stream_1'][starts[2].time().isoformat()], '_' + lots[2][0])
+
+    def test_auction_planning_planner(self):
+        now = datetime.now(TZ)
+        planner = Planner(self.db)
+        jobs = [spawn(planner.plan, test_tender_data_test_quick, now, False, str(i)) for i in range(20)]
+        joinall(jobs)
+        res = [job.value for job in jobs]
+        self.assertEqual(len(set([i[:2] for i in res])), 20)
+        self.assertEqual(planner.conflicts, 0)
+        start, stream, _ = res[0]
+        plan_id = "plantest_{}".format(start.date().isoformat())
+        self.assertLess(int(self.db.get(plan_id)['_rev'].split('-')[0]), 20)
+        planner.release(plan_id, start, "_0")
+        self.assertEqual(planner.plan(test_tender_data_test_quick, now)[:2], (start, stream))
+
+    def test_auction_planning_release_errors(self):
+        now = datetime.now(TZ)
+        start, _, _ = planning_auction(test_tender_data_test_quick, now, self.db)
+        plan_id = "plantest_{}".format(start.date().isoformat())
+        bad_id = "plantest_2000-01-01"
+        self.db.save({'_id': bad_id, 'streams': 1, 'stream_1': 'broken'})
+        releases = [(bad_id, start, "_1"), (plan_id, start, test_tender_data_test_quick.get('id', ''))]
+        self.assertEqual(Planner(self.db).release_many(releases), [False, True])
+        free_slots(self.db, releases)
+
+    def test_auction_planning_worker_timeout(self):
+        plan_id = "plantest_2000-01-01"
+        planner = Planner(self.db, idle_timeout=0.01)
+        release = Release(plan_id, '12:00:00', 'x')
+
+        class LateQueue(Queue):
+            late = [release]
+
+            def get(self, *args, **kwargs):
+                if self.late:
+                    self.put(self.late.pop())
+                    raise Empty
+                return Queue.get(self, *args, **kwargs)
+
+        worker = planner.workers[plan_id] = DayWorker(planner, plan_id)
+        worker.queue = LateQueue()
+        self.assertTrue(release.result.get(timeout=1))
+        worker.greenlet.join(timeout=1)
+        self.assertEqual(planner.workers, {})
+
+    def test_auction_planning_check_auctions(self):
+        now = datetime.now(TZ)
+        tenders = []
+        for i in tender_ids(3):
+            tender = deepcopy(test_tender_data_test_quick)
+            tender['id'] = i
+            start = planning_auction(tender, now, self.db)[0]
+            tender['auctionPeriod'] = {'startDate': (start + timedelta(minutes=1)).isoformat()}
+            tenders.append(tender)
+        plan_id = "plantest_{}".format(start.date().isoformat())
+        del tenders[1]['auctionPeriod']
+        check_auctions(self.db, tenders)
+        plan = self.db.get(plan_id)
+        booked = [t for i in plan if i.startswith('stream_') for t in plan[i].values() if t]
+        self.assertEqual(sorted(booked), [tenders[0]['id'], tenders[2]['id']])
+        self.assertEqual(len(plan['free']), 1)
+
+    def test_auction_planning_free_slots(self):
+        now = datetime.now(TZ)
+        res = [planning_auction(test_tender_data_test_quick, now, self.db, lot_id=str(i))[0] for i in range(3)]
+        plan_id = "plantest_{}".format(res[0].date().isoformat())
+        rev = int(self.db.get(plan_id)['_rev'].split('-')[0])
+        free_slots(self.db, [(plan_id, start, "_{}".format(i)) for i, start in enumerate(res)])
+        plan = self.db.get(plan_id)
+        self.assertEqual(int(plan['_rev'].split('-')[0]), rev + 1)
+        self.assertEqual(len(plan['free']), 3)
+
     def test_auction_planning_buffer(self):
         some_date = datetime(2015, 9, 21, 6, 30)
         date = some_date.date()
@@ -641,8 +854,463 @@ class TenderPlanning(BaseWebTest):
         self.assertEqual(res.date(), ndate)
 
 
+class WorkingDaysTest(unittest.TestCase):
+
+    def test_lookups(self):
+        calendar = {'_id': 'calendar', '_rev': '1-x', '2015-09-22': True, '2015-09-23': False}
+        days = WorkingDays(calendar)
+        friday = datetime(2015, 9, 18).date()
+        self.assertEqual(days.next(friday), friday)
+        self.assertEqual(days.next(friday + timedelta(days=1)), friday + timedelta(days=3))
+        self.assertEqual(days.add(friday, 1), friday + timedelta(days=3))
+        self.assertEqual(days.add(friday, 2), friday + timedelta(days=5))
+        self.assertEqual(days.add(friday, 300), days.add(days.add(friday, 100), 200))
+        self.assertTrue(days.is_holiday(friday + timedelta(days=4)))
+
+
+class SmootherTest(unittest.TestCase):
+
+    def test_pick(self):
+        smoother = Smoother(max_rate=2)
+        start = TZ.localize(datetime(2015, 9, 18, 12))
+        for i in range(6):
+            smoother.add(smoother.pick(start, 10, 12))
+        self.assertEqual(sorted(smoother.counts.values()), [2, 2, 2])
+        run_time = smoother.pick(start, 10, 12)
+        self.assertEqual(run_time, start + timedelta(seconds=13))
+        smoother.discard(start + timedelta(seconds=10))
+        self.assertEqual(smoother.pick(start, 10, 12), start + timedelta(seconds=10))
+        now = datetime_to_utc_timestamp(start)
+        self.assertEqual(smoother.due(12, now), 3)
+        self.assertEqual(smoother.due(14, now), 5)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.patched = retry_module.time, retry_module.sleep
+        retry_module.time, retry_module.sleep = self.clock.time, self.clock.sleep
+
+    def tearDown(self):
+        retry_module.time, retry_module.sleep = self.patched
+
+    def test_delays(self):
+        delays = list(Retry(attempts=10, base_delay=1, max_delay=4).delays())
+        self.assertEqual(len(delays), 9)
+        for attempt, delay in enumerate(delays):
+            cap = min(4, 2 ** attempt)
+            self.assertTrue(cap / 2. <= delay <= cap)
+
+    def test_budget(self):
+        calls = []
+        retry = Retry(attempts=100, base_delay=1, max_delay=4, budget=20)
+        with self.assertRaises(RetryBudgetExceeded) as cm:
+            retry(lambda: calls.append(1) or False, bool)
+        self.assertEqual(cm.exception.args, (False,))
+        self.assertLessEqual(sum(self.clock.sleeps), 20)
+        self.assertEqual(len(calls), len(self.clock.sleeps) + 1)
+
+    def test_attempts(self):
+        results = iter([ValueError(), False, True])
+
+        def call():
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        self.assertTrue(Retry(attempts=3)(call, bool))
+        self.assertEqual(len(self.clock.sleeps), 2)
+        with self.assertRaises(RetryBudgetExceeded) as cm:
+            Retry(attempts=2)(lambda: 1 / 0)
+        self.assertIsInstance(cm.exception.args[0], ZeroDivisionError)
+
+
+class PushTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = GeventScheduler(timezone=TZ)
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+        set_dispatcher(None)
+
+    def test_local_dispatch_once(self):
+        calls = []
+
+        def view(request):
+            calls.append(request.matchdict['tender_id'])
+            raise ValueError()
+        registry = type('Registry', (object,), {'api_url': 'http://localhost/api/', 'callback_url': 'http://localhost/'})()
+        set_dispatcher(registry)
+        scheduler_module.DISPATCHER.tender_routes['resync'] = view
+        with self.assertRaises(PushFailed) as cm:
+            push('http://localhost/resync/' + tender_ids(1)[0], None)
+        self.assertEqual(calls, tender_ids(1))
+        self.assertEqual(cm.exception.job_args, ['http://localhost/resync/' + tender_ids(1)[0], None])
+
+    def test_requeue_job(self):
+        tender_id = tender_ids(1)[0]
+        event = type('Event', (object,), {'job_id': tender_id, 'exception': PushFailed('', None, push_tender, [RECHECK, tender_id])})()
+        now = datetime.now(TZ)
+        requeue_job(self.scheduler, event)
+        job = self.scheduler.get_job(tender_id)
+        self.assertEqual(job.args, (RECHECK, tender_id))
+        self.assertTrue(now + timedelta(seconds=60) <= job.next_run_time <= now + timedelta(seconds=301))
+        event.exception = ValueError()
+        job.remove()
+        requeue_job(self.scheduler, event)
+        self.assertIsNone(self.scheduler.get_job(tender_id))
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, json=None):
+        self.status_code = status_code
+        self._json = json
+
+    def json(self):
+        return self._json
+
+
+class SyncListingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.pages = {}
+        self.patched = scheduler_module.get_request, scheduler_module.schedule_listing
+        scheduler_module.get_request = self.get_request
+        scheduler_module.schedule_listing = self.schedule_listing
+        self.scheduler = GeventScheduler(timezone=TZ)
+        self.scheduler.start()
+        self.registry = type('Registry', (object,), {
+            'api_url': 'http://localhost/api/',
+            'api_token': '',
+            'callback_url': 'http://localhost/',
+            'cluster': None,
+            'db': MemoryDatabase(),
+            'planner': None,
+            'scheduler': self.scheduler,
+            'sync_id': 'sync',
+            'sync_queue_size': 2,
+        })()
+        self.request = JobRequest(self.registry, 'resync_all')
+        next_check = (datetime.now(TZ) + timedelta(days=1)).isoformat()
+        tenders = tender_listing(4, next_check)
+        for i, data in enumerate([tenders[:2], tenders[2:], []]):
+            self.pages['page{}'.format(i)] = {'data': data, 'next_page': {'uri': 'page{}'.format(i + 1)}}
+
+    def tearDown(self):
+        scheduler_module.get_request, scheduler_module.schedule_listing = self.patched
+        self.scheduler.shutdown()
+
+    def get_request(self, url, auth, headers=None):
+        self.events.append(('fetch', url))
+        if url not in self.pages:
+            return FakeResponse(404)
+        return FakeResponse(200, self.pages[url])
+
+    def schedule_listing(self, parsed, scheduler):
+        if parsed and parsed[0][0].get('fail'):
+            raise ValueError()
+        gevent.sleep(0.01)
+        self.events.append(('scheduled', len(parsed)))
+        self.patched[1](parsed, scheduler)
+
+    def test_overlap(self):
+        state = sync_listing(self.request, 'page0', check=False, cursor='forward')
+        self.assertIsNone(state['error'])
+        self.assertLess(self.events.index(('fetch', 'page1')), self.events.index(('scheduled', 2)))
+        self.assertEqual(len(self.scheduler.get_jobs()), 4)
+
+    def test_error(self):
+        self.pages['page1']['data'][0]['fail'] = True
+        state = sync_listing(self.request, 'page0', check=False, cursor='forward')
+        self.assertIsInstance(state['error'], ValueError)
+        self.assertEqual(state['url'], 'page1')
+        self.assertEqual(state['tenders'], 2)
+        self.assertEqual(self.registry.db.get('sync')['forward']['url'], 'page1')
+
+    def test_stop(self):
+        state = sync_listing(self.request, 'page0', check=False, cursor='forward')
+        self.assertTrue(state['stopped'])
+        self.assertEqual(state['url'], 'page3')
+        self.assertEqual(state['tenders'], 4)
+        self.assertEqual([i for i in self.events if i[0] == 'fetch'], [('fetch', 'page0'), ('fetch', 'page1'), ('fetch', 'page2')])
+        self.assertEqual(self.registry.db.get('sync')['forward']['pages'], 3)
+        self.events = []
+        state = sync_listing(self.request, 'page9', check=False)
+        self.assertEqual(state['url'], '')
+        self.assertEqual(self.events, [('fetch', 'page9'), ('scheduled', 0)])
+
+
+class OutboundTest(unittest.TestCase):
+
+    def test_token_bucket(self):
+        clock = FakeClock()
+        patched = outbound_module.time, outbound_module.sleep
+        outbound_module.time, outbound_module.sleep = clock.time, clock.sleep
+        try:
+            bucket = TokenBucket(rate=2, burst=3)
+            for _ in range(5):
+                bucket.acquire()
+            self.assertEqual(clock.now, 1001.0)
+            clock.now += 10
+            for _ in range(3):
+                bucket.acquire()
+            self.assertEqual(clock.now, 1011.0)
+            for _ in range(5):
+                TokenBucket().acquire()
+            self.assertEqual(clock.now, 1011.0)
+        finally:
+            outbound_module.time, outbound_module.sleep = patched
+
+    def test_concurrency(self):
+        outbound = Outbound(concurrency=2)
+        active, peaks = [], []
+
+        def call(url):
+            with outbound.limit(url):
+                active.append(url)
+                peaks.append(len(active))
+                gevent.sleep(0.01)
+                active.remove(url)
+        joinall([spawn(call, 'http://localhost/api/{}'.format(i)) for i in range(6)] + [spawn(call, 'http://other/api/')])
+        self.assertEqual(max(peaks), 3)
+        self.assertEqual(outbound.hosts['localhost'][0].counter, 2)
+
+    def test_configure(self):
+        outbound = Outbound()
+        outbound.configure({'outbound.concurrency': '4', 'outbound.rate': '5', 'outbound.pool_size': '3'})
+        self.assertEqual((outbound.concurrency, outbound.rate, outbound.pool_size), (4, 5.0, 3))
+        self.assertEqual(outbound.session.get_adapter('http://localhost/')._pool_maxsize, 3)
+
+
+class ParseDateTest(unittest.TestCase):
+
+    def test_parse_date(self):
+        for value in ['2015-09-18T12:00:00+03:00', '2015-09-18T12:00:00.123456789Z', '2015-09-18T12:00:00-05:30', '2015-09-18T12:00:00', '0001']:
+            for tz in [TZ, None]:
+                self.assertEqual(parse_date_cached(value, tz).isoformat(), parse_date(value, tz).isoformat())
+        value = '2015-09-18T12:00:00+03:00'
+        self.assertEqual(parse_date_cached(value, TZ, TZ).isoformat(), parse_date(value, TZ).astimezone(TZ).isoformat())
+        self.assertIs(parse_date_cached(value, TZ, TZ), parse_date_cached(value, TZ, TZ))
+
+
+class FeedUrlTest(unittest.TestCase):
+
+    def test_with_opt_fields(self):
+        url = 'http://localhost/api/tenders?feed=changes&offset=1.5&opt_fields=lots%2Cstatus%2Cnext_check%2CauctionPeriod'
+        self.assertEqual(with_opt_fields(url), url)
+        self.assertEqual(with_opt_fields('http://localhost/api/tenders?feed=changes&offset=1.5&opt_fields=lots'),
+                         'http://localhost/api/tenders?feed=changes&offset=1.5&opt_fields=lots%2Cstatus%2CauctionPeriod%2Cnext_check')
+
+
+class JobStoreTestMixin(object):
+    """Tests of a batching job store, which `create_store` returns."""
+
+    def create_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        super(JobStoreTestMixin, self).setUp()
+        self.store = self.create_store()
+        self.scheduler = GeventScheduler(timezone=TZ)
+        self.scheduler.add_jobstore(self.store)
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+        super(JobStoreTestMixin, self).tearDown()
+
+    def test_batch_upsert(self):
+        tenders = tender_listing(10, (datetime.now(TZ) + timedelta(days=1)).isoformat())
+        with self.store.batch():
+            process_listing(tenders, self.scheduler, None, False)
+            self.assertEqual(self.store._lookup_jobs(['recheck_' + i['id'] for i in tenders]), {})
+        jobs = self.scheduler.get_jobs()
+        self.assertEqual(len(jobs), 10)
+        self.assertEqual(self.store.upsert_jobs(jobs), 0)
+        job = jobs[0]
+        self.scheduler.add_job(push_tender, 'date', run_date=job.next_run_time + timedelta(minutes=1), id=job.id, args=job.args, replace_existing=True)
+        self.assertEqual(self.store.upsert_jobs(self.scheduler.get_jobs()), 0)
+        self.assertEqual(self.store.lookup_jobs([job.id])[job.id].next_run_time, job.next_run_time + timedelta(minutes=1))
+
+    def test_batch_rollback(self):
+        tenders = tender_listing(10, (datetime.now(TZ) + timedelta(days=1)).isoformat())
+        with self.assertRaises(ValueError):
+            with self.store.batch():
+                process_listing(tenders, self.scheduler, None, False)
+                raise ValueError()
+        self.assertEqual(self.scheduler.get_jobs(), [])
+
+    def test_iter_jobs(self):
+        run_date = datetime.now(TZ) + timedelta(days=1)
+        for job_id in ['aa', 'ab', 'ba', 'recheck_aa', 'recheck_ab', 'recheck_ba', 'resync_all', 'resync_back', 'x']:
+            self.scheduler.add_job(push, 'date', run_date=run_date, id=job_id, args=['', None])
+        job_ids = lambda *args, **kwargs: [i for i, _ in iter_jobs(self.scheduler, *args, **kwargs)]
+        self.assertEqual(job_ids(None, 're'), [])
+        self.assertEqual(job_ids(None, 'a'), ['aa', 'ab', 'recheck_aa', 'recheck_ab'])
+        self.assertEqual(job_ids(after='ab'), ['ba', 'recheck_aa', 'recheck_ab', 'recheck_ba', 'resync_all', 'resync_back', 'x'])
+        self.assertEqual(job_ids('resync_all'), ['resync_all'])
+        self.assertEqual(job_ids('resync'), ['aa', 'ab', 'ba', 'x'])
+        self.assertEqual(summarize_jobs(self.scheduler)[0]['resync'], 4)
+
+    def test_coalesce(self):
+        now = datetime.now(TZ)
+        tenders = [
+            {'id': tender_id, 'next_check': (now + delay).isoformat(), 'auctionPeriod': {'shouldStartAfter': (now + timedelta(days=1)).isoformat()}}
+            for tender_id, delay in zip(tender_ids(3)[1:], (timedelta(seconds=1), timedelta(days=1)))
+        ]
+        set_coalesce_window(600)
+        try:
+            process_listing(tenders, self.scheduler, None, False)
+            jobs = dict([(i.id, i) for i in self.scheduler.get_jobs()])
+            self.assertEqual(sorted(jobs), [tenders[0]['id'], tenders[1]['id'], 'recheck_' + tenders[1]['id']])
+            self.assertTrue(rechecks(jobs[tenders[0]['id']]))
+            self.assertFalse(rechecks(jobs[tenders[1]['id']]))
+            process_listing(tenders, self.scheduler, None, False)
+            self.assertEqual(dict([(i.id, i.next_run_time) for i in self.scheduler.get_jobs()]), dict([(i.id, i.next_run_time) for i in jobs.values()]))
+        finally:
+            set_coalesce_window(60)
+
+
+class JobStoreTest(JobStoreTestMixin, unittest.TestCase):
+
+    def create_store(self):
+        return SQLAlchemyJobStore(url='sqlite://')
+
+    def test_batch_errors(self):
+        tenders = tender_listing(10, (datetime.now(TZ) + timedelta(days=1)).isoformat())
+        process_listing(tenders[:1], self.scheduler, None, False)
+        get_states = self.store._get_states
+        self.store._get_states = lambda job_ids, *columns: self.store.__dict__.pop('_get_states') and []
+        with self.store.batch():
+            process_listing(tenders, self.scheduler, None, False)
+        self.assertEqual(self.store._get_states, get_states)
+        self.assertEqual(len(self.scheduler.get_jobs()), 10)
+
+
+class TimerWheelJobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = mkstemp()
+        os.close(fd)
+        os.remove(self.path)
+        self.store = TimerWheelJobStore(self.path)
+        self.scheduler = GeventScheduler(jobstores={'default': self.store}, timezone=TZ)
+        self.scheduler.start()
+
+    def tearDown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_jobs(self):
+        now = datetime.now(TZ)
+        tenders = [{'id': tender_id, 'next_check': (now + timedelta(days=i + 1)).isoformat()} for i, tender_id in enumerate(tender_ids(10))]
+        process_listing(tenders, self.scheduler, None, False)
+        jobs = self.scheduler.get_jobs()
+        self.assertEqual(len(jobs), 10)
+        job = jobs[0]
+        self.assertEqual(job.args, (RECHECK, tenders[0]['id']))
+        self.assertIsInstance(self.store.wheel.get(job.id), JobRecord)
+        self.scheduler.add_job(push_tender, 'date', run_date=now + timedelta(days=20), id=job.id, args=job.args, replace_existing=True)
+        self.scheduler.remove_job(jobs[1].id)
+        next_run_time = self.store.get_next_run_time()
+        self.assertTrue(jobs[2].next_run_time <= next_run_time < jobs[2].next_run_time + timedelta(seconds=1))
+        self.assertEqual(self.store.get_due_jobs(next_run_time - timedelta(seconds=1)), [])
+        self.assertEqual([i.id for i in self.store.get_due_jobs(now + timedelta(days=4))], [jobs[2].id])
+        self.assertEqual(self.store.lookup_jobs([job.id])[job.id].next_run_time, now + timedelta(days=20))
+        self.scheduler.shutdown()
+        store = TimerWheelJobStore(self.path)
+        self.assertEqual([(i.id, i.next_run_time, i.args) for i in store.get_all_jobs()],
+                         [(i.id, i.next_run_time, i.args) for i in self.store.get_all_jobs()])
+
+
+class ClusterTest(BaseWebTest):
+    scheduler = False
+
+    def test_partitions(self):
+        nodes = [Cluster(self.db, node_id) for node_id in ('a', 'b', 'c')]
+        for node in nodes:
+            node.renew()
+        for node in nodes:
+            node.refresh()
+        ids = tender_ids(300)
+        owned = [set([i for i in ids if node.owns(i)]) for node in nodes]
+        self.assertEqual(sum([len(i) for i in owned]), 300)
+        self.assertEqual(set.union(*owned), set(ids))
+        self.assertTrue(all([len(i) > 50 for i in owned]))
+        nodes[2].stop()
+        changes = []
+        nodes[0].on_change = changes.append
+        nodes[0].refresh()
+        self.assertEqual(changes, [nodes[0]])
+        self.assertEqual(nodes[0].nodes, ('a', 'b'))
+        self.assertTrue(nodes[0].gained)
+        self.assertTrue(owned[0] <= set([i for i in ids if nodes[0].owns(i)]))
+        nodes[2].renew()
+        nodes[0].refresh()
+        self.assertEqual(nodes[0].nodes, ('a', 'b', 'c'))
+        self.assertFalse(nodes[0].gained)
+
+    def test_process_listing(self):
+        node = Cluster(self.db, 'a')
+        node.nodes = ('a', 'b')
+        tenders = tender_listing(10, (datetime.now(TZ) + timedelta(days=1)).isoformat())
+        scheduler = self.app.app.registry.scheduler
+        process_listing(tenders, scheduler, self.db, False, cluster=node)
+        self.assertEqual(
+            set([job.id for job in scheduler.get_jobs() if job.id.startswith('recheck_')]),
+            set(['recheck_' + i['id'] for i in tenders if node.owner(i['id']) == 'a']))
+
+
+class CouchDBJobStoreTest(JobStoreTestMixin, BaseWebTest):
+    scheduler = False
+
+    def create_store(self):
+        return CouchDBJobStore(self.db)
+
+    def test_jobs(self):
+        now = datetime.now(TZ).replace(microsecond=0)
+        for i in range(3):
+            self.scheduler.add_job(push, 'date', run_date=now + timedelta(days=i + 1), id=str(i), args=['', None])
+        self.assertEqual(self.store.get_next_run_time(), now + timedelta(days=1))
+        self.assertEqual([job.id for job in self.store.get_due_jobs(now + timedelta(days=2))], ['0', '1'])
+        self.scheduler.remove_job('0')
+        self.assertEqual([job.id for job in self.store.get_all_jobs()], ['1', '2'])
+        self.assertIsNone(self.store.lookup_job('0'))
+
+
 def suite():
     suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ClusterTest))
+    suite.addTest(unittest.makeSuite(CouchDBJobStoreTest))
+    suite.addTest(unittest.makeSuite(FeedUrlTest))
+    suite.addTest(unittest.makeSuite(JobStoreTest))
+    suite.addTest(unittest.makeSuite(OutboundTest))
+    suite.addTest(unittest.makeSuite(ParseDateTest))
+    suite.addTest(unittest.makeSuite(PushTest))
+    suite.addTest(unittest.makeSuite(RetryTest))
+    suite.addTest(unittest.makeSuite(SmootherTest))
+    suite.addTest(unittest.makeSuite(SyncListingTest))
     suite.addTest(unittest.makeSuite(SimpleTest))
     suite.addTest(unittest.makeSuite(TenderLotTest))
     suite.addTest(unittest.makeSuite(TenderLotTest2))
@@ -654,6 +1322,8 @@ def suite():
     suite.addTest(unittest.makeSuite(TenderTest3))
     suite.addTest(unittest.makeSuite(TenderTest4))
     suite.addTest(unittest.makeSuite(TendersTest))
+    suite.addTest(unittest.makeSuite(TimerWheelJobStoreTest))
+    suite.addTest(unittest.makeSuite(WorkingDaysTest))
     return suite
 
 
@@ -1,12 +1,59 @@
 import os
+import re
+from collections import OrderedDict
 from datetime import datetime
-from pytz import timezone
+from iso8601 import parse_date as parse_iso8601
+from pytz import FixedOffset, timezone, utc
 
 TZ = timezone(os.environ['TZ'] if 'TZ' in os.environ else 'Europe/Kiev')
+DATE_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?(?:(Z)|([+-])(\d{2}):(\d{2}))?$')
+DATE_CACHE_SIZE = 10000
+DATE_CACHE = OrderedDict()
+
+
+def _parse_date(value, default_timezone):
+    match = DATE_RE.match(value)
+    if not match:
+        return parse_iso8601(value, default_timezone)
+    year, month, day, hour, minute, second, fraction, zulu, sign, offset_hours, offset_minutes = match.groups()
+    if zulu:
+        tzinfo = utc
+    elif sign:
+        offset = int(offset_hours) * 60 + int(offset_minutes)
+        tzinfo = FixedOffset(-offset if sign == '-' else offset)
+    else:
+        tzinfo = default_timezone
+    microsecond = int(fraction[:6].ljust(6, '0')) if fraction else 0
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond, tzinfo)
+
+
+def parse_date(value, default_timezone=utc, tz=None):
+    """Parse an ISO 8601 timestamp like `iso8601.parse_date`, converted to
+    tz when given.
+
+    The `YYYY-MM-DDTHH:MM:SS[.ffffff][Z|+HH:MM]` format of the tenders API
+    is parsed by a single regular expression, other values by iso8601.
+    Results are memoized in an LRU cache of `DATE_CACHE_SIZE` entries, as
+    lots of a listing page often share timestamps.
+    """
+    key = (value, default_timezone, tz)
+    try:
+        result = DATE_CACHE.pop(key)
+    except KeyError:
+        result = _parse_date(value, default_timezone)
+        if tz is not None:
+            result = result.astimezone(tz)
+        while len(DATE_CACHE) >= DATE_CACHE_SIZE:
+            DATE_CACHE.popitem(last=False)
+    DATE_CACHE[key] = result
+    return result
 
 
 def add_logging_context(event):
-    request = event.request
+    set_logging_context(event.request)
+
+
+def set_logging_context(request):
     params = {
         'TENDERS_API_URL': request.registry.api_url,
         'TAGS': 'python,chronograph',
@@ -1,5 +1,14 @@
+from itertools import islice
+from json import dumps
+from iso8601 import ParseError, parse_date
+from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.view import view_config
+from time import time
+from openprocurement.chronograph.jobstores import JOB_KINDS, iter_jobs, summarize_jobs
+from openprocurement.chronograph.metrics import JOBS, JOBS_DUE, REGISTRY
 from openprocurement.chronograph.scheduler import (
+    SMOOTHER,
+    TZ,
     delete_holiday,
     get_calendar,
     get_streams,
@@ -9,8 +18,13 @@ from openprocurement.chronograph.scheduler import (
     resync_tenders_back,
     set_holiday,
     set_streams,
+    sync_progress,
 )
 
+DUE_WINDOWS = (60, 300, 3600)
+JOBS_INTERVAL = 60
+JOBS_COUNTED = (None, 0)
+
 
 @view_config(route_name='home', renderer='json')
 def home_view(request):
@@ -20,6 +34,75 @@ def home_view(request):
     ])}
 
 
+@view_config(route_name='jobs')
+def jobs_view(request):
+    """Stream a page of jobs ordered by id."""
+    params = request.params
+    kind = params.get('kind') or None
+    if kind and kind not in JOB_KINDS:
+        raise HTTPBadRequest('Unknown job kind')
+    try:
+        start = params.get('start') and parse_date(params['start'], TZ)
+        end = params.get('end') and parse_date(params['end'], TZ)
+        limit = min(max(int(params.get('limit', 100)), 1), 1000)
+    except (ParseError, ValueError):
+        raise HTTPBadRequest('Invalid filter')
+    jobs = iter_jobs(request.registry.scheduler, kind, params.get('prefix', ''), start, end, params.get('cursor') or None)
+
+    def body():
+        yield '{"jobs": ['
+        count, cursor = 0, None
+        for job_id, next_run_time in islice(jobs, limit):
+            yield (',' if count else '') + dumps({
+                'id': job_id,
+                'next_run_time': next_run_time and next_run_time.astimezone(TZ).isoformat()
+            })
+            count, cursor = count + 1, job_id
+        yield '], "next": {}}}'.format(dumps(cursor if count == limit else None))
+
+    response = request.response
+    response.content_type = 'application/json'
+    response.app_iter = body()
+    return response
+
+
+@view_config(route_name='jobs_summary', renderer='json')
+def jobs_summary_view(request):
+    kinds, buckets = summarize_jobs(request.registry.scheduler)
+    return {
+        'kinds': kinds,
+        'buckets': [{'start': start.astimezone(TZ).isoformat(), 'count': count} for start, count in buckets]
+    }
+
+
+def count_jobs(scheduler):
+    """Set the job counts gauge at most once per `JOBS_INTERVAL`."""
+    global JOBS_COUNTED
+    if JOBS_COUNTED[0] is scheduler and time() - JOBS_COUNTED[1] < JOBS_INTERVAL:
+        return
+    kinds, _ = summarize_jobs(scheduler)
+    for kind in JOB_KINDS:
+        JOBS.set(kinds.get(kind, 0), kind=kind)
+    JOBS_COUNTED = (scheduler, time())
+
+
+@view_config(route_name='metrics')
+def metrics_view(request):
+    count_jobs(request.registry.scheduler)
+    for window in DUE_WINDOWS:
+        JOBS_DUE.set(SMOOTHER.due(window) * 60.0 / window, window=window)
+    response = request.response
+    response.content_type = 'text/plain'
+    response.body = REGISTRY.render()
+    return response
+
+
+@view_config(route_name='sync', renderer='json')
+def sync_view(request):
+    registry = request.registry
+    return sync_progress(registry.db, registry.scheduler, registry.sync_id)
+
+
 @view_config(route_name='resync_all', renderer='json')
 def resync_all(request):
     return resync_tenders(request)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from math import ceil
+
+DUE = -1
+
+
+class TimerWheel(object):
+    """Hierarchical timer wheel of values keyed by id.
+
+    Times are whole seconds, rounded up. Level 0 has a slot per second of
+    the current `2 ** bits` seconds and every next level a slot per whole
+    level below it; times past the top level wait in an overflow set.
+    Adding, replacing and removing a value is O(1). `advance` moves a whole
+    slot of seconds that passed to the due set at once, cascades the slots
+    of upper levels down as their turn comes and jumps over empty levels.
+    """
+
+    def __init__(self, now, bits=8, levels=4):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = levels
+        self.slots = [[None] * (1 << bits) for _ in xrange(levels)]
+        self.counts = [0] * levels
+        self.current = int(now)
+        self.due = set()
+        self.overflow = set()
+        self.values = {}
+        self.index = {}
+        self._next = None
+        self._next_known = True
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def add(self, key, when, value):
+        """Add or replace the value of key due at timestamp when."""
+        if key in self.index:
+            self.remove(key)
+        tick = int(ceil(when))
+        self.values[key] = value
+        self._place(key, tick)
+        if self._next_known and (self._next is None or tick < self._next):
+            self._next = tick
+
+    def remove(self, key):
+        tick, level, slot = self.index.pop(key)
+        del self.values[key]
+        if tick == self._next:
+            self._next_known = False
+        if level == DUE:
+            self.due.discard(key)
+        elif level == self.levels:
+            self.overflow.discard(key)
+        else:
+            keys = self.slots[level][slot]
+            keys.discard(key)
+            if not keys:
+                self.slots[level][slot] = None
+            self.counts[level] -= 1
+
+    def advance(self, now):
+        """Move the values due by timestamp now to the due set; returns it."""
+        now = int(now)
+        while self.current <= now:
+            level = 0
+            while level < self.levels and not self.counts[level]:
+                level += 1
+            if level:
+                span = 1 << (self.bits * level)
+                self.current = min(now + 1, (self.current | (span - 1)) + 1)
+            else:
+                slot = self.current & self.mask
+                keys = self.slots[0][slot]
+                if keys:
+                    self.slots[0][slot] = None
+                    self.counts[0] -= len(keys)
+                    for key in keys:
+                        self.index[key] = (self.current, DUE, None)
+                    self.due.update(keys)
+                self.current += 1
+            if not self.current & self.mask:
+                self._cascade()
+        return self.due
+
+    def next_time(self):
+        """Return the earliest timestamp of the values or None.
+
+        The result is kept until the value due at it is removed, so upper
+        level slots are only searched again after that.
+        """
+        if not self._next_known:
+            self._next = self._find_next()
+            self._next_known = True
+        return self._next
+
+    def _find_next(self):
+        if self.due:
+            return min([self.index[key][0] for key in self.due])
+        for level in xrange(self.levels):
+            if not self.counts[level]:
+                continue
+            first = (self.current >> (self.bits * level)) & self.mask
+            for keys in self.slots[level][first:]:
+                if keys:
+                    return min([self.index[key][0] for key in keys])
+        if self.overflow:
+            return min([self.index[key][0] for key in self.overflow])
+        return None
+
+    def items(self):
+        """Yield (key, timestamp, value) of all values."""
+        for key, value in self.values.iteritems():
+            yield key, self.index[key][0], value
+
+    def _place(self, key, tick):
+        level, slot = DUE, None
+        if tick < self.current:
+            self.due.add(key)
+        else:
+            level = self.levels
+            for i in xrange(self.levels):
+                shift = self.bits * (i + 1)
+                if tick >> shift == self.current >> shift:
+                    level, slot = i, (tick >> (self.bits * i)) & self.mask
+                    break
+            if slot is None:
+                self.overflow.add(key)
+            else:
+                keys = self.slots[level][slot]
+                if keys is None:
+                    keys = self.slots[level][slot] = set()
+                keys.add(key)
+                self.counts[level] += 1
+        self.index[key] = (tick, level, slot)
+
+    def _cascade(self):
+        """Spread the upper level slots whose turn came to the levels below."""
+        levels = [i for i in xrange(1, self.levels + 1) if not self.current & ((1 << (self.bits * i)) - 1)]
+        for level in reversed(levels):
+            if level == self.levels:
+                keys, self.overflow = self.overflow, set()
+            else:
+                slot = (self.current >> (self.bits * level)) & self.mask
+                keys = self.slots[level][slot]
+                if not keys:
+                    continue
+                self.slots[level][slot] = None
+                self.counts[level] -= len(keys)
+            for key in keys:
+                self._place(key, self.index[key][0])
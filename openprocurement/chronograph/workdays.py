@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+
+class WorkingDays(object):
+    """Working days of a calendar document.
+
+    Ordinals of working days are precomputed in a sorted list that grows by
+    `span` days whenever a lookup leaves the covered range, so the next or
+    N-th working day is found by bisection.
+    """
+
+    def __init__(self, calendar, span=366):
+        self.rev = calendar.get('_rev')
+        self.holidays = set([i for i in calendar if not i.startswith('_') and calendar[i]])
+        self.span = span
+        self.first = self.last = date.today().toordinal()
+        self.days = []
+
+    def is_holiday(self, day):
+        return day.isoformat() in self.holidays or day.weekday() in [5, 6]  # skip Saturday and Sunday
+
+    def working(self, first, last):
+        return [i for i in xrange(first, last) if not self.is_holiday(date.fromordinal(i))]
+
+    def cover(self, first, last):
+        if first < self.first:
+            first = min(first, self.first - self.span)
+            self.days[:0] = self.working(first, self.first)
+            self.first = first
+        if last > self.last:
+            last = max(last, self.last + self.span)
+            self.days.extend(self.working(self.last, last))
+            self.last = last
+
+    def next(self, day):
+        """Return the first working day on or after day."""
+        ordinal = day.toordinal()
+        self.cover(ordinal, ordinal + 1)
+        while bisect_left(self.days, ordinal) == len(self.days):
+            self.cover(ordinal, self.last + 1)
+        return date.fromordinal(self.days[bisect_left(self.days, ordinal)])
+
+    def add(self, day, n):
+        """Return the n-th working day after day."""
+        ordinal = day.toordinal()
+        self.cover(ordinal, ordinal + 1)
+        while bisect_right(self.days, ordinal) + n > len(self.days):
+            self.cover(ordinal, self.last + 1)
+        return date.fromordinal(self.days[bisect_right(self.days, ordinal) + n - 1])
+
+
+CACHE = {}
+
+
+def get_working_days(calendar):
+    """Return WorkingDays of a calendar document, rebuilt only when the
+    document revision changes."""
+    key = calendar.get('_id')
+    cached = CACHE.get(key)
+    if cached is None or cached.rev != calendar.get('_rev'):
+        cached = CACHE[key] = WorkingDays(calendar)
+    return cached
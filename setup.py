@@ -11,7 +11,7 @@ requires = [
     'apscheduler',
     'chaussette',
     'couchdb',
-    'grequests',
+    'gevent',
     'iso8601',
     'ndg-httpsclient',
     'pbkdf2',